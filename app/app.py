@@ -1,24 +1,38 @@
+import csv
+import functools
 import httpx
+import json
+import numpy as np
+import operator
 import peewee
 from pt_stats.pt_sites.mteam import MTeamTorrentInfoFromSearch
 from settings import load_settings, AppSettings
 import sys
+import time
 import cyclopts
 from cyclopts import App as CliApp, Parameter
-from typing import Annotated, Any, Literal, Protocol
+from typing import Annotated, Any, Iterator, Literal, Protocol
 import attrs
-from qbittorrentapi import Client as QbtClient
-import qbittorrentapi as qbt_types
-import torf
 import asyncio as aio
-from pt_stats.pt_sites import MTeamClient
+from pt_stats.pt_sites import MTeamClient, Throttle
+from pt_stats.qbt import MainDataSync, AddVerifier, AsyncQbtClient
 from datetime import timedelta, datetime, timezone
+from pathlib import Path
 import pt_stats.db as db
 import pt_stats.db.models as db_schemas
-from utils import naturalsize, shorten, utc_now
+from pt_stats.torrent_cache import TorrentCache
+import pt_stats.db.queries as db_queries
+from pt_stats.db.compaction import compact_torrent_stats
+from pt_stats.db.export import export_torrent_stats, read_export_state
+from pt_stats.db.scoring import compute_torrent_scores, replace_torrent_scores
+from pt_stats.db.timeseries import TimeSeries, torrent_timeseries
+from utils import naturalsize, read_torrent_info, shorten, utc_now
+from pipeline import Stage, run_pipeline, stage_summary_table
+from planner import PruneCandidate, plan_prune, plan_ascending
+from scheduling import JobRunLog
 from rich.table import Table as RichTable
 from rich.console import Console
-from rich.progress import track
+from rich.progress import Progress
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import pendulum
 import importlib.metadata
@@ -62,6 +76,19 @@ def sample_stats():
     aio.run(app.qbt_sample_stats())
 
 
+@cli.command
+def compact_stats():
+    """Roll old torrent stats up into the hourly and daily tiers.
+
+    The raw rows rolled up are deleted. Off by default: set the retentions
+    in the 'stats' settings to enable it.
+    """
+    settings = load_settings("settings.yaml")
+    app = App.create(settings)
+
+    aio.run(app.compact_stats())
+
+
 @cli.command
 def daemon(
     dry_run: Annotated[
@@ -85,19 +112,49 @@ def daemon(
         # print(f"Time: {datetime.now().isoformat()}")
         await app.qbt_sample_stats(quiet=True)
 
+    async def job_compact_stats():
+        await app.compact_stats(quiet=True)
+
+    async def job_prune():
+        await app.qbt_prune(reserve_space=0, dry_run=dry_run)
+
+    cfg = settings.daemon
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(
+    runs = JobRunLog()
+    runs.listen(scheduler)
+    runs.add_job(
+        scheduler,
+        "add_free_torrents",
         job_add_free_torrents,
-        "interval",
-        hours=settings.daemon.add_free_torrent_interval_hours,
+        cfg.add_free_torrent_job,
+        hours=cfg.add_free_torrent_interval_hours,
         next_run_time=datetime.now() + timedelta(seconds=10),
     )
-    scheduler.add_job(
+    runs.add_job(
+        scheduler,
+        "sample_stats",
         job_sample_stats,
-        "interval",
-        minutes=settings.daemon.sample_stats_interval_minutes,
+        cfg.sample_stats_job,
+        minutes=cfg.sample_stats_interval_minutes,
         next_run_time=datetime.now(),
     )
+    runs.add_job(
+        scheduler,
+        "compact_stats",
+        job_compact_stats,
+        cfg.compact_stats_job,
+        hours=cfg.compact_stats_interval_hours,
+        next_run_time=datetime.now() + timedelta(minutes=1),
+    )
+    if cfg.prune_interval_hours > 0:
+        runs.add_job(
+            scheduler,
+            "prune",
+            job_prune,
+            cfg.prune_job,
+            hours=cfg.prune_interval_hours,
+            next_run_time=datetime.now() + timedelta(minutes=5),
+        )
 
     async def main():
         scheduler.start()
@@ -109,6 +166,8 @@ def daemon(
             pass
         finally:
             scheduler.shutdown()
+            app.qbt.close()
+            app.dbx.shutdown()
 
     aio.run(main())
 
@@ -133,6 +192,49 @@ def prune(
     aio.run(app.qbt_prune(reserve_space=int(space_to_free * 1024**3), dry_run=dry_run))
 
 
+@cli.command
+def export(
+    out: Annotated[
+        str, Parameter(name=["--out", "-o"], help="Directory of the Parquet files")
+    ] = "export",
+    full: Annotated[
+        bool,
+        Parameter(
+            name=["--full"],
+            help="Remove the previous export and export everything again",
+        ),
+    ] = False,
+    batch_size: Annotated[
+        int,
+        Parameter(
+            name=["--batch-size", "-b"],
+            help="Rows read from the database (and held in memory) at a time",
+        ),
+    ] = 100_000,
+):
+    """Export the torrent stats history to Parquet files partitioned by day."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print(
+            "Exporting needs pyarrow, install it with: pip install 'pt-stats[export]'",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    settings = load_settings("settings.yaml")
+    # Only reads the database, no need for the qBittorrent/MTeam clients
+    db.initialize(settings.db_path)
+
+    since = read_export_state(Path(out)) if not full else 0
+    begin = time.perf_counter()
+    summary = export_torrent_stats(Path(out), batch_size=batch_size, full=full)
+    print(
+        f"Exported {summary.rows} rows after id {since} into {summary.files} files "
+        f"in {time.perf_counter() - begin:.1f}s, last id {summary.last_id}."
+    )
+
+
 @cli_setting.command()
 def template(
     no_comments: Annotated[
@@ -238,6 +340,24 @@ def transfer(
             group="Duration",
         ),
     ] = utc_now(),
+    raw: Annotated[
+        bool,
+        Parameter(
+            name=["--raw"],
+            help="Compute from the samples instead of the hourly/daily rollups",
+        ),
+    ] = False,
+    output_format: Annotated[
+        Literal["table", "plain", "csv", "jsonl"],
+        Parameter(
+            name=["--format", "-f"],
+            help=(
+                "Output format. 'table' prints a table once all rows are read, "
+                "'plain' prints the rows as they are read, 'csv' and 'jsonl' "
+                "write machine-readable rows to stdout (the summary goes to stderr)"
+            ),
+        ),
+    ] = "table",
 ):
     settings = load_settings("settings.yaml")
     app = App.create(settings)
@@ -252,51 +372,220 @@ def transfer(
     if end.tzinfo is None:
         end = end.replace(tzinfo=pendulum.local_timezone())
 
-    print("Calculating transfer deltas from:")
-    print(f"Start:    {start.astimezone(pendulum.local_timezone()).isoformat()}")
-    print(f"End:      {end.astimezone(pendulum.local_timezone()).isoformat()}")
-    print(f"Duration: {end - start}")
+    # Keep stdout clean for the machine-readable formats
+    info = sys.stderr if output_format in ("csv", "jsonl") else sys.stdout
+    print("Calculating transfer deltas from:", file=info)
+    print(
+        f"Start:    {start.astimezone(pendulum.local_timezone()).isoformat()}",
+        file=info,
+    )
+    print(
+        f"End:      {end.astimezone(pendulum.local_timezone()).isoformat()}",
+        file=info,
+    )
+    print(f"Duration: {end - start}", file=info)
 
     start = start.astimezone(timezone.utc)
     end = end.astimezone(timezone.utc)
 
-    result = app.calc_transfer_deltas(start=start, end=end)
+    rows = app.iter_transfer_deltas(start=start, end=end, from_rollups=not raw)
 
-    table = RichTable(
-        title="Transfer Statistics for Torrents",
-    )
-    table.add_column("Hash", overflow="ellipsis", max_width=12, no_wrap=True)
-    table.add_column("Down")
-    table.add_column("Up")
-    table.add_column("Ratio")
-    table.add_column("Name", overflow="ellipsis", max_width=48, no_wrap=True)
+    # Rows are written as they are read, and the totals are summed in the
+    # same pass. Only the "table" format holds the rows until the end.
+    accu_down = accu_up = 0
+    if output_format == "table":
+        table = RichTable(
+            title="Transfer Statistics for Torrents",
+        )
+        table.add_column("Hash", overflow="ellipsis", max_width=12, no_wrap=True)
+        table.add_column("Down")
+        table.add_column("Up")
+        table.add_column("Ratio")
+        table.add_column("Name", overflow="ellipsis", max_width=48, no_wrap=True)
 
-    for t in result:
-        down = t.downloaded_delta
-        up = t.uploaded_delta
-        ratio = (up / down) if down > 0 else (float("inf") if up > 0 else 0.0)
+        for t in rows:
+            down, up = t.downloaded_delta, t.uploaded_delta
+            accu_down += down
+            accu_up += up
+            table.add_row(
+                t.torrent_hash,
+                naturalsize(down),
+                naturalsize(up),
+                format_ratio(up, down),
+                t.name,
+            )
+        console = Console()
+        console.print(table)
 
-        table.add_row(
-            t.torrent_hash,
-            naturalsize(down),
-            naturalsize(up),
-            f"{ratio:.1f}" if ratio != float("inf") else "∞",
-            t.name,
+    elif output_format == "plain":
+        print(f"\n{'Hash':<12}  {'Down':>10}  {'Up':>10}  {'Ratio':>6}  Name")
+        for t in rows:
+            down, up = t.downloaded_delta, t.uploaded_delta
+            accu_down += down
+            accu_up += up
+            print(
+                f"{t.torrent_hash[:12]:<12}  {naturalsize(down):>10}  "
+                f"{naturalsize(up):>10}  {format_ratio(up, down):>6}  "
+                f"{shorten(t.name, 48)}",
+                flush=True,
+            )
+
+    elif output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(
+            ["torrent_hash", "name", "downloaded_bytes", "uploaded_bytes", "ratio"]
         )
-    console = Console()
-    console.print(table)
-
-    accu_down = sum(t.downloaded_delta for t in result)
-    accu_up = sum(t.uploaded_delta for t in result)
-    accu_ratio = (
-        (accu_up / accu_down)
-        if accu_down > 0
-        else (float("inf") if accu_up > 0 else 0.0)
+        for t in rows:
+            down, up = t.downloaded_delta, t.uploaded_delta
+            accu_down += down
+            accu_up += up
+            writer.writerow(
+                [t.torrent_hash, t.name, down, up, up / down if down > 0 else ""]
+            )
+            sys.stdout.flush()
+
+    elif output_format == "jsonl":
+        for t in rows:
+            down, up = t.downloaded_delta, t.uploaded_delta
+            accu_down += down
+            accu_up += up
+            record = {
+                "torrent_hash": t.torrent_hash,
+                "name": t.name,
+                "downloaded_bytes": down,
+                "uploaded_bytes": up,
+                "ratio": up / down if down > 0 else None,
+            }
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+
+    print("\n=== Accumulated Transfer Statistics ===", file=info)
+    print(f"Total Downloaded: {naturalsize(accu_down)}", file=info)
+    print(f"Total Uploaded:   {naturalsize(accu_up)}", file=info)
+    print(f"Overall Ratio:    {format_ratio(accu_up, accu_down)}", file=info)
+
+
+@cli_report.command()
+def timeline(
+    minutes: Annotated[
+        int,
+        Parameter(
+            name=["--minutes", "-m"],
+            help="Number of minutes to look back",
+            group="Lookback",
+        ),
+    ] = 0,
+    hours: Annotated[
+        int,
+        Parameter(
+            name=["--hours", "-H"],
+            help="Number of hours to look back",
+            group="Lookback",
+        ),
+    ] = 0,
+    days: Annotated[
+        int,
+        Parameter(
+            name=["--days", "-d"],
+            help="Number of days to look back",
+            group="Lookback",
+        ),
+    ] = 0,
+    start: Annotated[
+        datetime,
+        Parameter(
+            name=["--start", "-s"],
+            help="Start datetime of the timeline",
+            group="Duration",
+        ),
+    ] = utc_now() - timedelta(days=1),
+    end: Annotated[
+        datetime,
+        Parameter(
+            name=["--end", "-e"],
+            help="End datetime of the timeline",
+            group="Duration",
+        ),
+    ] = utc_now(),
+    bucket_minutes: Annotated[
+        int,
+        Parameter(
+            name=["--bucket", "-b"],
+            help="Bucket size in minutes (buckets are aligned to UTC)",
+        ),
+    ] = 60,
+    torrent: Annotated[
+        list[str] | None,
+        Parameter(
+            name=["--torrent", "-t"],
+            help="Only the torrents whose hash starts with this prefix (repeatable)",
+        ),
+    ] = None,
+):
+    settings = load_settings("settings.yaml")
+    app = App.create(settings)
+
+    if minutes > 0 or hours > 0 or days > 0:
+        delta = timedelta(days=days, hours=hours, minutes=minutes)
+        end = utc_now()
+        start = end - delta
+
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=pendulum.local_timezone())
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=pendulum.local_timezone())
+    start = start.astimezone(timezone.utc)
+    end = end.astimezone(timezone.utc)
+
+    series = app.torrent_timeseries(
+        start, end, timedelta(minutes=bucket_minutes), hash_prefixes=torrent
     )
-    print("\n=== Accumulated Transfer Statistics ===")
-    print(f"Total Downloaded: {naturalsize(accu_down)}")
-    print(f"Total Uploaded:   {naturalsize(accu_up)}")
-    print(f"Overall Ratio:    {accu_ratio:.1f}")
+    print(f"Torrents: {len(series.torrent_id)}")
+
+    # Totals over the torrents, per bucket
+    uploaded = series.uploaded.sum(axis=0)
+    downloaded = series.downloaded.sum(axis=0)
+    upload_rate = series.upload_rate.sum(axis=0)
+    download_rate = series.download_rate.sum(axis=0)
+    active = (series.uploaded > 0).sum(axis=0)
+    has_samples = ~np.isnan(series.swarm_seeders)
+    seeders = np.nansum(series.swarm_seeders, axis=0)
+    leechers = np.nansum(series.swarm_leechers, axis=0)
+
+    table = RichTable(title="Transfer Timeline")
+    table.add_column("Bucket")
+    table.add_column("Up/s", justify="right")
+    table.add_column("Down/s", justify="right")
+    table.add_column("Up", justify="right")
+    table.add_column("Down", justify="right")
+    table.add_column("Active", justify="right")
+    table.add_column("Seeders", justify="right")
+    table.add_column("Leechers", justify="right")
+
+    for i, bucket_time in enumerate(series.bucket_time.tolist()):
+        local_time = bucket_time.replace(tzinfo=timezone.utc).astimezone(
+            pendulum.local_timezone()
+        )
+        sampled = has_samples[:, i].any()
+        table.add_row(
+            f"{local_time:%Y-%m-%d %H:%M}",
+            naturalsize(upload_rate[i]),
+            naturalsize(download_rate[i]),
+            naturalsize(uploaded[i]),
+            naturalsize(downloaded[i]),
+            str(active[i]),
+            f"{seeders[i]:.0f}" if sampled else "-",
+            f"{leechers[i]:.0f}" if sampled else "-",
+        )
+    Console().print(table)
+
+    print(f"Total Uploaded:   {naturalsize(uploaded.sum())}")
+    print(f"Total Downloaded: {naturalsize(downloaded.sum())}")
+
+
+def format_ratio(up: int, down: int) -> str:
+    if down > 0:
+        return f"{up / down:.1f}"
+    return "∞" if up > 0 else "0.0"
 
 
 #####
@@ -305,56 +594,103 @@ def transfer(
 @attrs.define
 class App:
     settings: AppSettings
-    qbt: QbtClient
+    qbt: AsyncQbtClient
     mteam: MTeamClient
     db_ok: bool
+    dbx: db.DatabaseExecutor = attrs.field(factory=db.DatabaseExecutor)
 
     _mteam_site: db_schemas.Sites = attrs.field(default=None, init=False)
+    _maindata: MainDataSync = attrs.field(factory=MainDataSync, init=False)
+    _stats_recorder: db.StatsRecorder = attrs.field(init=False)
+    _add_verifier: AddVerifier = attrs.field(init=False)
+    _torrent_cache: TorrentCache | None = attrs.field(init=False)
+    # Held by adding and pruning, so they never run at the same time
+    _quota_lock: aio.Lock = attrs.field(factory=aio.Lock, init=False)
+
+    @_add_verifier.default
+    def _default_add_verifier(self) -> AddVerifier:
+        return AddVerifier(fetch=self.qbt_present_hashes)
+
+    @_torrent_cache.default
+    def _default_torrent_cache(self) -> TorrentCache | None:
+        cfg = self.settings.adding
+        if cfg.torrent_cache_size <= 0:
+            return None
+        return TorrentCache(
+            root=cfg.torrent_cache_dir, max_bytes=cfg.torrent_cache_size
+        )
+
+    @_stats_recorder.default
+    def _default_stats_recorder(self) -> db.StatsRecorder:
+        return db.StatsRecorder(
+            record_on_change=self.settings.stats.record_on_change,
+            heartbeat=timedelta(minutes=self.settings.stats.heartbeat_interval_minutes),
+        )
 
     @staticmethod
     def create(settings: AppSettings) -> "App":
         # Initialize qBittorrent client
-        qbt = QbtClient(
+        qbt = AsyncQbtClient.create(
             host=settings.qbittorrent.api_base,
             username=settings.qbittorrent.username,
             password=settings.qbittorrent.password,
+            max_workers=settings.qbittorrent.max_connections,
         )
         try:
-            qbt.auth_log_in()
+            # No event loop yet, log in synchronously
+            qbt.client.auth_log_in()
         except Exception as e:
             print(f"Failed to connect to qBittorrent Web API: {e}", file=sys.stderr)
             sys.exit(1)
 
         # Initialize MTeam client
+        cfg_mteam = settings.mteam
+
+        def endpoint_throttle(rate: float) -> Throttle | None:
+            if rate <= 0:
+                return None
+            return Throttle(rate=rate, burst=cfg_mteam.rate_burst)
+
         mteam = MTeamClient(
-            api_base=settings.mteam.api_base,
-            api_key=settings.mteam.api_key,
-            http_client=httpx.AsyncClient(proxy=settings.mteam.proxy),
+            api_base=cfg_mteam.api_base,
+            api_key=cfg_mteam.api_key,
+            http_client=httpx.AsyncClient(proxy=cfg_mteam.proxy),
+            throttle=Throttle(rate=cfg_mteam.rate_limit, burst=cfg_mteam.rate_burst),
+            search_throttle=endpoint_throttle(cfg_mteam.search_rate_limit),
+            dl_token_throttle=endpoint_throttle(cfg_mteam.dl_token_rate_limit),
+            download_throttle=endpoint_throttle(cfg_mteam.download_rate_limit),
         )
 
         # Initialize database
         db.initialize(settings.db_path)
-        db.conn.create_tables(
-            [
-                db_schemas.Sites,
-                db_schemas.Torrents,
-                db_schemas.TorrentStats,
-            ]
-        )
+        db.create_schema()
 
-        db_schemas.StatsComputed.create_view()
-        db_schemas.TorrentsComputed.create_view()
-
-        return App(settings=settings, qbt=qbt, mteam=mteam, db_ok=True)
+        app = App(settings=settings, qbt=qbt, mteam=mteam, db_ok=True)
+        # Resolve the site record now, so that the DB executor threads
+        # only ever read it.
+        app.site_mteam
+        return app
 
     async def add_free_torrents(self, dry_run: bool = False):
-        free_torrents = await self.mteam.list_latest_free_torrents()
-        print(f"Found {len(free_torrents)} free torrents on MTeam.")
+        if self._quota_lock.locked():
+            print("Waiting for the running prune or add to finish...")
+        async with self._quota_lock:
+            await self._add_free_torrents(dry_run=dry_run)
 
-        # Filtering
+    async def _add_free_torrents(self, dry_run: bool):
+        # Filtering, as the torrents come in from the crawl
         filtered: list[MTeamTorrentInfoFromSearch] = []
         cfg = self.settings.filters
-        for t in free_torrents:
+        cfg_mteam = self.settings.mteam
+        found = 0
+        async for t in self.mteam.crawl_free_torrents(
+            modes=cfg_mteam.search_modes,
+            page_size=cfg_mteam.search_page_size,
+            max_pages=cfg_mteam.search_max_pages,
+            # torrents already added are skipped by the crawler
+            known=lambda ids: self.dbx.read(self.get_known_mteam_ids, ids),
+        ):
+            found += 1
             # filter by size
             if t.size > cfg.max_torrent_size:
                 continue
@@ -368,16 +704,14 @@ class App:
                 continue
             if t.leechers / t.seeders < cfg.min_l2s_ratio:
                 continue
-            # filter by existing records
-            if self.get_mteam_torrent(t.sitewise_id) is not None:
-                # already added
-                continue
             # if disk quota exceeded, skip
             if self.settings.disk_quota > 0 and t.size > self.settings.disk_quota:
                 continue
 
             filtered.append(t)
 
+        print(f"Found {found} new free torrents on MTeam.")
+
         # select top first N torrents that fit in the disk quota
         if self.settings.disk_quota > 0:
             selected: list[MTeamTorrentInfoFromSearch] = []
@@ -415,63 +749,117 @@ class App:
         console.print(table)
 
         required_space = sum(t.size for t in filtered)
-        await self.qbt_prune(reserve_space=required_space, dry_run=dry_run)
+        await self._qbt_prune(reserve_space=required_space, dry_run=dry_run)
 
         if dry_run:
             print("Dry run mode, not actually adding torrents.")
             return
 
-        # Adding torrents
-        for t in track(filtered, description="Adding torrents...", transient=True):
+        # Adding torrents: download -> parse -> add & verify, each stage
+        # works on the next torrents while the later stages are busy.
+        cfg_adding = self.settings.adding
+
+        async def download(t: MTeamTorrentInfoFromSearch):
+            if self._torrent_cache is not None:
+                cached = await self.dbx.write(
+                    self._torrent_cache.get, self.site_mteam, t.sitewise_id
+                )
+                if cached is not None:
+                    return t, cached.data, cached.infohash
+
+            # Rate limited by the MTeam client throttle
+            torrent_meta = await self.mteam.download_torrent_metadata(t.sitewise_id)
+            return t, torrent_meta, None
+
+        async def parse(item: tuple[MTeamTorrentInfoFromSearch, bytes, str | None]):
+            t, torrent_meta, torrent_hash = item
+            if torrent_hash is not None:
+                # From the cache
+                return t, torrent_meta, torrent_hash
+
+            torrent_hash, files = await aio.to_thread(read_torrent_info, torrent_meta)
+            if self._torrent_cache is not None:
+                await self.dbx.write(
+                    self._torrent_cache.put,
+                    self.site_mteam,
+                    t.sitewise_id,
+                    torrent_meta,
+                    torrent_hash,
+                    files,
+                )
+            return t, torrent_meta, torrent_hash
+
+        async def add(item: tuple[MTeamTorrentInfoFromSearch, bytes, str]):
+            t, torrent_meta, torrent_hash = item
             try:
-                torrent_meta = await self.mteam.download_torrent_metadata(t.sitewise_id)
-                torrent = torf.Torrent.read_stream(torrent_meta)
-                torrent_hash = torrent.infohash
-
-                with db.conn.atomic() as txn:
-                    try:
-                        await self.qbt_add_torrent_and_verify(
-                            torrent_meta_bytes=torrent_meta,
-                            torrent_hash=torrent_hash,
-                            # qBittorrent may get a different name from the .torrent
-                            # file, so we use the original name here.
-                            name=t.name,
-                        )
-                    except TimeoutError as e:
-                        print(str(e))
-                        print(
-                            "The torrent adding may succeeded, but verification timeout, treating as success."
-                        )
-
-                    # Record in database
-                    torrent_in_db = db_schemas.Torrents.create(
-                        torrent_hash=torrent_hash,
-                        name=t.name,
-                        site=self.site_mteam,
-                        sitewise_id=t.sitewise_id,
-                        # MTeam use different hosts for different regions,
-                        # so we just use a relative URL here.
-                        url="/detail/" + t.sitewise_id,
-                        size_bytes=t.size,
-                    )
-
-                    # Also create an inital stats record
-                    db_schemas.TorrentStats.create(
-                        torrent=torrent_in_db,
-                        recorded_time=utc_now(),
-                        connected_seeders=0,
-                        swarm_seeders=t.seeders,
-                        connected_leechers=0,
-                        swarm_leechers=t.leechers,
-                        uploaded_bytes=0,
-                        downloaded_bytes=0,
-                    )
-
-                    # print(f"Succeed. Record ID: {record.record_id}")
+                await self.qbt_add_torrent_and_verify(
+                    torrent_meta_bytes=torrent_meta,
+                    torrent_hash=torrent_hash,
+                    # qBittorrent may get a different name from the .torrent
+                    # file, so we use the original name here.
+                    name=t.name,
+                    timeout=cfg_adding.verify_timeout_seconds,
+                )
+            except TimeoutError as e:
+                print(str(e))
+                print(
+                    "The torrent adding may succeeded, but verification timeout, treating as success."
+                )
 
-            except Exception as e:
-                print(f"Failed to add torrent {t.sitewise_id}: {e}")
-                continue
+            # Each torrent commits its own records, a failure of another
+            # torrent does not roll them back.
+            await self.dbx.write(self.record_added_torrent, t, torrent_hash)
+            return t
+
+        with Progress(transient=True) as progress:
+            task = progress.add_task("Adding torrents...", total=len(filtered))
+
+            def on_error(item, stage: Stage, e: Exception):
+                t = item if isinstance(item, MTeamTorrentInfoFromSearch) else item[0]
+                print(f"Failed to add torrent {t.sitewise_id} ({stage.name}): {e}")
+                progress.advance(task)
+
+            added, stage_stats = await run_pipeline(
+                filtered,
+                [
+                    Stage("download", download, cfg_adding.download_concurrency),
+                    Stage("parse", parse, cfg_adding.download_concurrency),
+                    Stage("add & verify", add, cfg_adding.add_concurrency),
+                ],
+                on_error=on_error,
+                on_done=lambda t: progress.advance(task),
+            )
+
+        print(f"Added {len(added)} of {len(filtered)} torrents.")
+        console.print(stage_summary_table(stage_stats))
+
+    def record_added_torrent(self, t: MTeamTorrentInfoFromSearch, torrent_hash: str):
+        """
+        Record a torrent added to qBittorrent in the database, with an
+        initial stats record.
+        """
+        with db.conn.atomic():
+            torrent_in_db = db_schemas.Torrents.create(
+                torrent_hash=torrent_hash,
+                name=t.name,
+                site=self.site_mteam,
+                sitewise_id=t.sitewise_id,
+                # MTeam use different hosts for different regions,
+                # so we just use a relative URL here.
+                url="/detail/" + t.sitewise_id,
+                size_bytes=t.size,
+            )
+
+            db_schemas.TorrentStats.create(
+                torrent=torrent_in_db,
+                recorded_time=utc_now(),
+                connected_seeders=0,
+                swarm_seeders=t.seeders,
+                connected_leechers=0,
+                swarm_leechers=t.leechers,
+                uploaded_bytes=0,
+                downloaded_bytes=0,
+            )
 
     async def qbt_add_torrent_and_verify(
         self, *, torrent_meta_bytes: bytes, torrent_hash: str, name: str, timeout=20
@@ -488,8 +876,7 @@ class App:
         if not torrent_hash:
             raise ValueError("Empty torrent hash provided.")
 
-        qbt = self.qbt
-        res = qbt.torrents_add(
+        res = await self.qbt.torrents_add(
             torrent_files=torrent_meta_bytes,
             rename=name,
             upload_limit=self.settings.qbittorrent.upload_speed_limit,
@@ -501,79 +888,132 @@ class App:
         # if res != 'Ok.':
         #     raise RuntimeError(f"qbt.torrents_add failed, error message: {res}")
 
-        elapsed = 0
-        while elapsed < timeout:
-            # Verify if the torrent is added
-            torrents = qbt.torrents_info(torrent_hashes=torrent_hash)
-            if not torrents:
-                # Not added yet, wait and retry
-                elapsed += 1
-                await aio.sleep(1)
-                continue
-            else:
-                # Successfully added
-                return
+        # All torrents being added are verified together, one torrent
+        # list query per poll interval.
+        await self._add_verifier.wait(torrent_hash, timeout=timeout)
 
-        raise TimeoutError(
-            f"Failed to add torrent with hash {torrent_hash} within {timeout} seconds."
-        )
+    async def qbt_present_hashes(self, torrent_hashes: list[str]) -> set[str]:
+        """
+        Return the hashes among `torrent_hashes` that qBittorrent knows.
+        """
+        infos = await self.qbt.torrents_info(torrent_hashes=torrent_hashes)
+        return {info.hash for info in infos}
 
     async def qbt_sample_stats(self, quiet: bool = False):
         """
         Sample torrent stats from qBittorrent and store them in the database.
+
+        The torrent list is pulled with the `sync/maindata` delta API, so
+        only the torrents that changed since the previous call are sent
+        by qBittorrent. The rest are read from the local mirror.
         """
         alive_torrents = {
             t.torrent_hash: t
-            for t in list(
-                db_schemas.Torrents.select().where(
-                    db_schemas.Torrents.delete_time.is_null()
-                )
+            for t in await self.dbx.read(
+                lambda: list(db_queries.alive_torrents_with_usage())
             )
         }
 
-        torrent_info_list: qbt_types.TorrentInfoList = []  # type: ignore
-        sample_times = []
-
-        batch_size = 32
-        torrent_hashes = list(alive_torrents.keys())
-        for i in (
-            (lambda x: x)
-            if quiet
-            else (
-                lambda x: track(
-                    x, description="Sampling torrent stats...", transient=True
+        maindata = self._maindata
+        changed = maindata.apply(await self.qbt.sync_maindata(rid=maindata.rid))
+        sample_time = utc_now()
+
+        usage_source = self.settings.usage_source
+        rows: list[db.StatsRow] = []
+        usage: dict[int, int] = {}  # torrent id -> used bytes, if changed
+        for torrent_hash, t in alive_torrents.items():
+            info = maindata.torrents.get(torrent_hash)
+
+            used_bytes = None
+            if usage_source == "declared":
+                # Also restores the declared sizes after another source
+                used_bytes = t.size_bytes
+            elif info is not None and "size" in info:
+                used_bytes = info["size"]
+                if usage_source == "downloaded":
+                    used_bytes -= info.get("amount_left", 0)
+            if used_bytes is not None and used_bytes != t.used_bytes:
+                usage[t.id] = used_bytes
+
+            if info is None:
+                # Not (or no longer) in qBittorrent
+                continue
+
+            rows.append(
+                db.StatsRow(
+                    torrent_id=t.id,
+                    recorded_time=sample_time,
+                    connected_seeders=info["num_seeds"],
+                    swarm_seeders=info["num_complete"],
+                    connected_leechers=info["num_leechs"],
+                    swarm_leechers=info["num_incomplete"],
+                    uploaded_bytes=info["uploaded"],
+                    downloaded_bytes=info["downloaded"],
                 )
             )
-        )(range(0, len(torrent_hashes), batch_size)):
-            batch_hashes = torrent_hashes[i : i + batch_size]
-            infos = self.qbt.torrents_info(torrent_hashes=batch_hashes)
-            torrent_info_list.extend(infos)
-            sample_times.extend([utc_now()] * len(infos))
 
-        with db.conn.atomic():
-            for info, sample_time in zip(torrent_info_list, sample_times):
-                t = alive_torrents[info.hash]
+        summary = await self.dbx.write(self._stats_recorder.record, rows)
+        if usage:
+            await self.dbx.write(db.reconcile_torrent_usage, usage)
 
-                db_schemas.TorrentStats.create(
-                    torrent=t,
-                    recorded_time=sample_time,
-                    connected_seeders=info.num_seeds,
-                    swarm_seeders=info.num_complete,
-                    connected_leechers=info.num_leechs,
-                    swarm_leechers=info.num_incomplete,
-                    uploaded_bytes=info.uploaded,
-                    downloaded_bytes=info.downloaded,
-                )
+        if not quiet:
+            print(
+                f"Sampled {len(rows)} torrents, {len(changed)} changed since "
+                f"the last sample. {summary.inserted} rows written, "
+                f"{summary.extended} idle rows extended."
+            )
+
+    async def compact_stats(self, quiet: bool = False):
+        """
+        Roll old torrent stats up into the hourly and daily tiers, and
+        drop what is past the retention of the last tier.
+        """
+        cfg = self.settings.stats
+
+        def retention(days: float) -> timedelta | None:
+            return timedelta(days=days) if days > 0 else None
+
+        retentions = (
+            cfg.raw_retention_days,
+            cfg.hourly_retention_days,
+            cfg.daily_retention_days,
+        )
+        if all(days <= 0 for days in retentions):
+            if not quiet:
+                print("Compaction is off: no retention is set in 'stats'.")
+            return
+
+        summary = await self.dbx.write(
+            compact_torrent_stats,
+            utc_now(),
+            raw_retention=retention(cfg.raw_retention_days),
+            hourly_retention=retention(cfg.hourly_retention_days),
+            daily_retention=retention(cfg.daily_retention_days),
+        )
+
+        if not quiet:
+            print(
+                f"Compacted {summary.raw_compacted} raw samples into hourly buckets, "
+                f"{summary.hourly_compacted} hourly buckets into daily buckets, "
+                f"expired {summary.daily_expired} daily buckets "
+                f"and {summary.transfer_expired} transfer rollups."
+            )
 
     async def qbt_prune(self, reserve_space: int, dry_run: bool = False):
         """
         Prune torrents from qBittorrent to free up the specified space (in bytes).
         """
+        if self._quota_lock.locked():
+            print("Waiting for the running prune or add to finish...")
+        async with self._quota_lock:
+            await self._qbt_prune(reserve_space=reserve_space, dry_run=dry_run)
+
+    async def _qbt_prune(self, reserve_space: int, dry_run: bool):
         if self.settings.disk_quota <= 0:
             # No disk quota set
             return
 
-        total_used = self.get_total_used_space()
+        total_used = await self.dbx.read(self.get_total_used_space)
         print(
             f"Disk quota: {naturalsize(self.settings.disk_quota)}, "
             f"currently used: {naturalsize(total_used)}, "
@@ -587,33 +1027,61 @@ class App:
 
         to_free = (total_used + reserve_space) - self.settings.disk_quota
 
-        candidate_torrents = list(
-            db_schemas.Torrents.select(
-                db_schemas.Torrents,
-                db_schemas.TorrentsComputed.popularity,
-                db_schemas.TorrentsComputed.ratio,
+        cfg_scoring = self.settings.scoring
+        recent = cfg_scoring.mode == "recent"
+        score_of: dict[int, float] = {}
+        if recent:
+            now = utc_now()
+            # Score on a reader thread; only the replacement takes the writer
+            scores = await self.dbx.read(
+                compute_torrent_scores,
+                now,
+                window=timedelta(days=cfg_scoring.window_days),
+                half_life=timedelta(days=cfg_scoring.half_life_days),
+                demand_weight=cfg_scoring.demand_weight,
             )
-            .join(db_schemas.TorrentsComputed, attr="computed")
-            .where(db_schemas.Torrents.delete_time.is_null())
-            .order_by(db_schemas.TorrentsComputed.popularity.asc())
-        )
-
-        accumulated_freed = 0
-        for idx, t in enumerate(candidate_torrents):
-            if accumulated_freed >= to_free:
-                break
+            score_of = dict(zip(scores.torrent_id.tolist(), scores.score.tolist()))
+            if not dry_run:
+                await self.dbx.write(replace_torrent_scores, now, scores)
 
-            accumulated_freed += t.size_bytes
+        candidate_torrents = await self.dbx.read(
+            lambda: list(db_queries.prune_candidates(with_scores=False))
+        )
 
-        to_prune = candidate_torrents[: idx]
+        # Free the space at the least loss of popularity, counting the
+        # space of each torrent the way the quota does.
+        candidates = [
+            PruneCandidate(
+                item=t,
+                size=t.usage_row.used_bytes,
+                # Torrents without samples in the window score 0
+                popularity=(
+                    score_of.get(t.id, 0.0) if recent else t.computed.popularity
+                ),
+            )
+            for t in candidate_torrents
+        ]
+        plan = plan_prune(candidates, to_free)
+        baseline = plan_ascending(candidates, to_free)
+        to_prune = sorted(plan.selected, key=lambda c: c.popularity)
 
         print(
-            f"The following {len(to_prune)} torrents will be pruned to free up {naturalsize(accumulated_freed)}:"
+            f"The following {len(to_prune)} torrents will be pruned to free up {naturalsize(plan.freed)}:"
         )
+        print(
+            f"Popularity lost: {plan.popularity_lost:.1f} ({plan.method}), "
+            f"{baseline.popularity_lost:.1f} when pruning the least popular first "
+            f"({len(baseline.selected)} torrents, {naturalsize(baseline.freed)})."
+        )
+        if not plan.enough:
+            print(
+                f"Warning: pruning all candidates frees only {naturalsize(plan.freed)} "
+                f"of the {naturalsize(to_free)} needed."
+            )
         table = RichTable(
             title="Torrents to be Pruned",
         )
-        table.add_column("Popularity", justify="right")
+        table.add_column("Score" if recent else "Popularity", justify="right")
         table.add_column("Ratio")
         table.add_column("Size")
         table.add_column("Accu.Sz.")
@@ -621,12 +1089,13 @@ class App:
         table.add_column("Name", overflow="ellipsis", max_width=48, no_wrap=True)
 
         _acc = 0
-        for t in to_prune:
-            _acc += t.size_bytes
+        for c in to_prune:
+            t = c.item
+            _acc += c.size
             table.add_row(
-                f"{t.computed.popularity:.1f}",
+                f"{c.popularity:.1f}",
                 f"{t.computed.ratio:.1f}",
-                naturalsize(t.size_bytes),
+                naturalsize(c.size),
                 naturalsize(_acc),
                 t.torrent_hash,
                 t.name,
@@ -638,21 +1107,78 @@ class App:
             print("\nDry run mode, not actually removing torrents.")
             return
 
-        for t in track(to_prune, description="Pruning torrents...", transient=True):
-            with db.conn.atomic():
-                # Remove from qBittorrent
-                try:
-                    self.qbt.torrents_delete(
-                        torrent_hashes=t.torrent_hash, delete_files=True
-                    )
-                    # Mark as deleted in database
-                    t.delete_time = utc_now()
-                    t.save()
-                except Exception as e:
-                    print(
-                        f"Failed to prune torrent {t.torrent_hash} | {shorten(t.name, 48)}: {e}"
-                    )
-                    continue
+        pruned = {c.item.torrent_hash: c for c in to_prune}
+        deleted, failed = await self.qbt_delete_torrents([c.item for c in to_prune])
+        print(
+            f"Pruned {len(deleted)} torrents, freed "
+            f"{naturalsize(sum(pruned[t.torrent_hash].size for t in deleted))}."
+        )
+        for torrent_hash, reason in failed.items():
+            t = pruned[torrent_hash].item
+            print(
+                f"Failed to prune torrent {torrent_hash} | {shorten(t.name, 48)}: {reason}"
+            )
+
+    async def qbt_delete_torrents(
+        self, torrents: list[db_schemas.Torrents]
+    ) -> tuple[list[db_schemas.Torrents], dict[str, str]]:
+        """
+        Delete torrents (and their files) from qBittorrent and mark them as
+        deleted in the database.
+
+        The hashes are sent in chunks of `qbittorrent.delete_batch_size`,
+        all chunks at once. The removal is then confirmed with a single
+        `torrents_info` query, and the confirmed torrents are marked as
+        deleted with one UPDATE.
+
+        Returns the deleted torrents, and the hashes that are still in
+        qBittorrent with the reason.
+        """
+        hashes = [t.torrent_hash for t in torrents]
+        errors: dict[str, str] = {}
+
+        async def delete_chunk(chunk: list[str]):
+            try:
+                await self.qbt.torrents_delete(torrent_hashes=chunk, delete_files=True)
+            except Exception as e:
+                errors.update((torrent_hash, str(e)) for torrent_hash in chunk)
+
+        batch_size = self.settings.qbittorrent.delete_batch_size
+        await aio.gather(
+            *(delete_chunk(chunk) for chunk in peewee.chunked(hashes, batch_size))
+        )
+
+        try:
+            still_present = await self.qbt_present_hashes(hashes)
+        except Exception as e:
+            # Cannot tell what was removed, a later prune retries them
+            return [], {h: f"Failed to confirm the removal: {e}" for h in hashes}
+
+        failed = {
+            h: errors.get(h, "Still listed by qBittorrent after the deletion")
+            for h in hashes
+            if h in still_present
+        }
+        deleted = [t for t in torrents if t.torrent_hash not in failed]
+        await self.dbx.write(
+            self.mark_torrents_deleted, [t.id for t in deleted], utc_now()
+        )
+        return deleted, failed
+
+    def mark_torrents_deleted(self, torrent_ids: list[int], when: datetime) -> int:
+        """
+        Set `delete_time` of the given torrents that are not deleted yet.
+        """
+        Torrents = db_schemas.Torrents
+        updated = 0
+        with db.conn.atomic():
+            for batch in peewee.chunked(torrent_ids, db.max_variable_number() - 1):
+                updated += (
+                    Torrents.update(delete_time=when)
+                    .where(Torrents.id.in_(batch) & Torrents.delete_time.is_null())
+                    .execute()
+                )
+        return updated
 
     @property
     def site_mteam(self) -> db_schemas.Sites:
@@ -664,36 +1190,84 @@ class App:
         )
         return self._mteam_site
 
-    def get_mteam_torrent(self, sitewise_id: str) -> db_schemas.Torrents | None:
-        torrent = db_schemas.Torrents.get_or_none(
-            (db_schemas.Torrents.site == self.site_mteam)
-            & (db_schemas.Torrents.sitewise_id == sitewise_id)
-        )
-        return torrent
+    def get_known_mteam_ids(self, sitewise_ids: list[str]) -> set[str]:
+        """
+        Return the MTeam sitewise IDs among `sitewise_ids` that already have
+        a record in the database, with one query (per chunk of SQLite's
+        variable limit).
+        """
+        Torrents = db_schemas.Torrents
+        known: set[str] = set()
+        for batch in peewee.chunked(sitewise_ids, db.max_variable_number() - 1):
+            query = Torrents.select(Torrents.sitewise_id).where(
+                (Torrents.site == self.site_mteam) & (Torrents.sitewise_id.in_(batch))
+            )
+            known.update(sitewise_id for (sitewise_id,) in query.tuples())
+        return known
 
     def get_total_used_space(self) -> int:
         """
-        Get the total used space occupied by all torrents.
+        Get the total used space occupied by all torrents, as counted by
+        the `usage_source` setting.
         """
-        total = (
-            db_schemas.Torrents.select(peewee.fn.SUM(db_schemas.Torrents.size_bytes))
-            .where(db_schemas.Torrents.delete_time.is_null())
-            .scalar()
-        )
-        return total or 0
+        return db.total_used_bytes()
 
-    def calc_transfer_deltas(self, start: datetime, end: datetime) -> list[Any]:
+    def calc_transfer_deltas(
+        self, start: datetime, end: datetime, from_rollups: bool = True
+    ) -> list[Any]:
         """
         Calculate the transfer deltas (uploaded and downloaded bytes) for
         torrents between the given start and end times.
 
+        With `from_rollups`, the whole hours and days of the range are
+        read from the transfer rollups, and only the partial hours at the
+        ends from the samples. Otherwise everything is computed from the
+        samples.
+
         Returns a list of Torrents with additional attributes:
             - uploaded_delta: int
             - downloaded_delta: int
 
+        A counter that drops within the range (the torrent was re-added)
+        counts from 0 again instead of giving a negative delta.
+
         Raises ValueError if start or end datetime does not have tzinfo set.
         """
+        return list(self._transfer_deltas_query(start, end, from_rollups))
+
+    def torrent_timeseries(
+        self,
+        start: datetime,
+        end: datetime,
+        bucket: timedelta,
+        hash_prefixes: list[str] | None = None,
+    ) -> TimeSeries:
+        """
+        Bucketed time series (see `pt_stats.db.timeseries`) of the torrents
+        whose hash starts with one of `hash_prefixes`, or of all torrents.
+        """
+        torrent_ids = None
+        if hash_prefixes:
+            T = db_schemas.Torrents
+            cond = functools.reduce(
+                operator.or_, (T.torrent_hash.startswith(p) for p in hash_prefixes)
+            )
+            torrent_ids = [t.id for t in T.select(T.id).where(cond)]
+        return torrent_timeseries(start, end, bucket, torrent_ids)
 
+    def iter_transfer_deltas(
+        self, start: datetime, end: datetime, from_rollups: bool = True
+    ) -> Iterator[Any]:
+        """
+        Same as `calc_transfer_deltas`, but yield the rows as named tuples
+        while the cursor is read, without caching them in the query.
+        """
+        query = self._transfer_deltas_query(start, end, from_rollups)
+        return query.namedtuples().iterator()
+
+    def _transfer_deltas_query(
+        self, start: datetime, end: datetime, from_rollups: bool
+    ) -> peewee.RawQuery:
         # start, end should be UTC timestamps or
         # have tzinfo set to be converted to UTC.
         def normalize_dt(dt: datetime, name: str) -> datetime:
@@ -704,62 +1278,14 @@ class App:
         start = normalize_dt(start, "start")
         end = normalize_dt(end, "end")
 
-        # Magical SQL query to compute deltas
-        TorrentStats = db_schemas.TorrentStats
-        Torrents = db_schemas.Torrents
-        fn = peewee.fn
-
-        StartStats = TorrentStats.alias()
-        EndStats = TorrentStats.alias()
-
-        boundary = (
-            TorrentStats.select(
-                TorrentStats.torrent,
-                fn.MIN(TorrentStats.recorded_time).alias("min_ts"),
-                fn.MAX(TorrentStats.recorded_time).alias("max_ts"),
-            )
-            .where(
-                (TorrentStats.recorded_time >= start)
-                & (TorrentStats.recorded_time <= end)
-            )
-            .group_by(TorrentStats.torrent)
-            .cte("boundary")
-        )
-
-        query = (
-            Torrents.select(
-                Torrents,
-                # deltas
-                (EndStats.uploaded_bytes - StartStats.uploaded_bytes).alias(
-                    "uploaded_delta"
-                ),
-                (EndStats.downloaded_bytes - StartStats.downloaded_bytes).alias(
-                    "downloaded_delta"
-                ),
-            )
-            # Torrents -> boundary
-            .join(boundary, on=(Torrents.id == boundary.c.torrent_id))
-            # boundary -> StartStats
-            .join(
-                StartStats,
-                on=(
-                    (StartStats.torrent == boundary.c.torrent_id)
-                    & (StartStats.recorded_time == boundary.c.min_ts)
-                ),
-            )
-            # boundary -> EndStats
-            .join(
-                EndStats,
-                on=(
-                    (EndStats.torrent == boundary.c.torrent_id)
-                    & (EndStats.recorded_time == boundary.c.max_ts)
-                ),
-            )
-            .with_cte(boundary)
-        )
-
-        results = list(query)
-        return results
+        # Sum the steps between consecutive samples in one pass. Old
+        # samples may have been compacted into the hourly/daily tiers, so
+        # read the samples from whichever tier holds them.
+        if from_rollups:
+            sql, params = db_queries.rollup_transfer_deltas_sql(start, end)
+        else:
+            sql, params = db_queries.transfer_deltas_sql(start, end)
+        return db_schemas.Torrents.raw(sql, *params)
 
 
 if __name__ == "__main__":
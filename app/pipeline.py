@@ -0,0 +1,142 @@
+import asyncio as aio
+import time
+import attrs
+from typing import Any, Awaitable, Callable, Iterable
+from rich.table import Table as RichTable
+
+
+@attrs.define
+class Stage:
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+
+
+@attrs.define
+class StageStats:
+    name: str
+    succeeded: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0  # sum of the time spent on each item
+    max_seconds: float = 0.0  # slowest item
+    first_start: float | None = None
+    last_end: float | None = None
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_start is None or self.last_end is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+
+# Marks the end of the input of a stage
+_DONE = object()
+
+
+async def run_pipeline(
+    items: Iterable[Any],
+    stages: list[Stage],
+    *,
+    on_error: Callable[[Any, Stage, Exception], None] | None = None,
+    on_done: Callable[[Any], None] | None = None,
+) -> tuple[list[Any], list[StageStats]]:
+    """
+    Push `items` through `stages`. Each stage runs `concurrency` workers,
+    the output of a stage is the input of the next one, so an item can be
+    in the last stage while the next items are still in the first one.
+
+    If a stage raises, `on_error(item, stage, exc)` is called and the
+    item is dropped. `on_done` is called with the output of every item
+    that left the last stage.
+
+    Returns the outputs of the last stage (in completion order) and the
+    timing of every stage.
+    """
+    queues: list[aio.Queue] = [aio.Queue() for _ in range(len(stages) + 1)]
+    stats = [StageStats(name=stage.name) for stage in stages]
+    results: list[Any] = []
+
+    async def worker(idx: int):
+        stage, st = stages[idx], stats[idx]
+        inbox, outbox = queues[idx], queues[idx + 1]
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # Let the sibling workers see it too
+                await inbox.put(_DONE)
+                return
+
+            begin = time.perf_counter()
+            if st.first_start is None:
+                st.first_start = begin
+            try:
+                out = await stage.fn(item)
+            except Exception as e:
+                st.failed += 1
+                if on_error is not None:
+                    on_error(item, stage, e)
+            else:
+                st.succeeded += 1
+                await outbox.put(out)
+            finally:
+                end = time.perf_counter()
+                st.busy_seconds += end - begin
+                st.max_seconds = max(st.max_seconds, end - begin)
+                st.last_end = end
+
+    async def collector():
+        while True:
+            out = await queues[-1].get()
+            if out is _DONE:
+                return
+            results.append(out)
+            if on_done is not None:
+                on_done(out)
+
+    for item in items:
+        queues[0].put_nowait(item)
+    queues[0].put_nowait(_DONE)
+
+    collecting = aio.create_task(collector())
+    closers: list[aio.Task] = []
+    for idx, stage in enumerate(stages):
+        workers = [
+            aio.create_task(worker(idx)) for _ in range(max(1, stage.concurrency))
+        ]
+        # Workers of later stages start right away, they only wait for
+        # the workers of this stage to close their input.
+        closers.append(aio.create_task(_close_after(workers, queues[idx + 1])))
+    await collecting
+    await aio.gather(*closers)
+
+    return results, stats
+
+
+async def _close_after(workers: list[aio.Task], outbox: aio.Queue):
+    await aio.gather(*workers)
+    await outbox.put(_DONE)
+
+
+def stage_summary_table(stats: list[StageStats]) -> RichTable:
+    table = RichTable(title="Pipeline Stage Timing")
+    table.add_column("Stage")
+    table.add_column("OK", justify="right")
+    table.add_column("Failed", justify="right")
+    table.add_column("Wall", justify="right")
+    table.add_column("Busy", justify="right")
+    table.add_column("Avg", justify="right")
+    table.add_column("Max", justify="right")
+
+    for st in stats:
+        total = st.succeeded + st.failed
+        avg = st.busy_seconds / total if total else 0.0
+        table.add_row(
+            st.name,
+            str(st.succeeded),
+            str(st.failed),
+            f"{st.wall_seconds:.1f}s",
+            f"{st.busy_seconds:.1f}s",
+            f"{avg:.1f}s",
+            f"{st.max_seconds:.1f}s",
+        )
+    return table
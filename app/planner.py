@@ -0,0 +1,162 @@
+import math
+from typing import Any, NamedTuple, Sequence
+
+# Largest DP table (items x size units) solved exactly. Beyond it the
+# greedy plan is used alone.
+MAX_DP_CELLS = 1_000_000
+# Size resolution of the DP: `to_free` is split into at most this many units
+DP_UNITS = 4096
+# Below this many units per item the rounding makes the DP too coarse
+MIN_DP_UNITS = 64
+
+
+class PruneCandidate(NamedTuple):
+    item: Any  # whatever the caller wants back, e.g. a Torrents row
+    size: int  # bytes freed by deleting it
+    popularity: float  # what is lost by deleting it
+
+
+class PrunePlan(NamedTuple):
+    selected: list[PruneCandidate]
+    freed: int
+    popularity_lost: float
+    method: str  # "none", "dp", "greedy" or "ascending"
+    enough: bool  # whether `freed` reaches the requested space
+
+
+def _plan(selected: list[PruneCandidate], method: str, to_free: int) -> PrunePlan:
+    freed = sum(c.size for c in selected)
+    return PrunePlan(
+        selected=selected,
+        freed=freed,
+        popularity_lost=sum(c.popularity for c in selected),
+        method=method,
+        enough=freed >= to_free,
+    )
+
+
+def plan_ascending(candidates: Sequence[PruneCandidate], to_free: int) -> PrunePlan:
+    """
+    The simple strategy: delete the least popular torrents first until
+    enough space is freed.
+    """
+    selected: list[PruneCandidate] = []
+    freed = 0
+    for c in sorted(candidates, key=lambda c: c.popularity):
+        if freed >= to_free:
+            break
+        selected.append(c)
+        freed += c.size
+    return _plan(selected, "ascending", to_free)
+
+
+def plan_greedy(candidates: Sequence[PruneCandidate], to_free: int) -> PrunePlan:
+    """
+    Approximate plan: take candidates by ascending popularity per byte,
+    then drop the ones that turned out unnecessary (most popular first).
+    Also considers the cheapest single candidate that frees enough alone,
+    which bounds the greedy error.
+    """
+    order = sorted(candidates, key=lambda c: c.popularity / max(c.size, 1))
+    selected: list[PruneCandidate] = []
+    freed = 0
+    for c in order:
+        if freed >= to_free:
+            break
+        selected.append(c)
+        freed += c.size
+
+    for c in sorted(selected, key=lambda c: c.popularity, reverse=True):
+        if freed - c.size >= to_free:
+            selected.remove(c)
+            freed -= c.size
+
+    plan = _plan(selected, "greedy", to_free)
+
+    single = [c for c in candidates if c.size >= to_free]
+    if single:
+        best = min(single, key=lambda c: c.popularity)
+        if best.popularity < plan.popularity_lost:
+            plan = _plan([best], "greedy", to_free)
+    return plan
+
+
+def plan_dp(
+    candidates: Sequence[PruneCandidate], to_free: int, units: int
+) -> PrunePlan:
+    """
+    Min-cost covering knapsack over sizes scaled to `units` units of
+    `to_free`: `best[j]` is the least popularity lost to free at least `j`
+    units. Sizes are rounded down, so a plan found here frees at least
+    `to_free` bytes for real. The last cell stands for "`units` or more".
+    """
+    unit = math.ceil(to_free / units)
+    need = math.ceil(to_free / unit)
+
+    inf = math.inf
+    best = [inf] * (need + 1)
+    best[0] = 0.0
+    # took[i][j]: item i improved best[j]. For the last cell, which many
+    # sources reach, cap_source[i] is the source cell of the improvement.
+    took: list[bytearray] = []
+    cap_source: list[int] = []
+
+    for c in candidates:
+        w = c.size // unit
+        p = c.popularity
+        row = bytearray(need + 1)
+        source = -1
+        # Descending, so each item is used at most once
+        for j in range(need, -1, -1):
+            if best[j] == inf:
+                continue
+            t = min(need, j + w)
+            if t == j:
+                continue
+            cost = best[j] + p
+            if cost < best[t]:
+                best[t] = cost
+                row[t] = 1
+                if t == need:
+                    source = j
+        took.append(row)
+        cap_source.append(source)
+
+    if best[need] == inf:
+        return _plan([], "dp", to_free)
+
+    selected: list[PruneCandidate] = []
+    j = need
+    for i in range(len(candidates) - 1, -1, -1):
+        if j == 0:
+            break
+        if took[i][j]:
+            selected.append(candidates[i])
+            j = cap_source[i] if j == need else j - candidates[i].size // unit
+    return _plan(selected, "dp", to_free)
+
+
+def plan_prune(candidates: Sequence[PruneCandidate], to_free: int) -> PrunePlan:
+    """
+    Choose the candidates to delete so that at least `to_free` bytes are
+    freed while losing the least total popularity.
+
+    Small instances are solved with a knapsack DP over scaled sizes
+    (near optimal, up to the rounding of sizes), large ones with the
+    greedy plan. The best of the applicable plans is returned. If all
+    candidates together do not free enough, all of them are selected.
+    """
+    if to_free <= 0:
+        return _plan([], "none", to_free)
+    if sum(c.size for c in candidates) < to_free:
+        return _plan(list(candidates), "greedy", to_free)
+
+    plans = [plan_greedy(candidates, to_free)]
+
+    units = min(DP_UNITS, MAX_DP_CELLS // max(len(candidates), 1))
+    if units >= MIN_DP_UNITS:
+        dp = plan_dp(candidates, to_free, units)
+        if dp.enough:
+            plans.append(dp)
+
+    return min(plans, key=lambda plan: (plan.popularity_lost, plan.freed))
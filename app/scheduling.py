@@ -0,0 +1,109 @@
+import time
+import attrs
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+from apscheduler.events import (
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobEvent,
+)
+from apscheduler.schedulers.base import BaseScheduler
+from settings import JobSettings
+
+
+def _format_time(dt: datetime) -> str:
+    return dt.astimezone().isoformat(timespec="milliseconds")
+
+
+@attrs.define
+class JobRunLog:
+    """
+    Adds interval jobs to a scheduler with their `JobSettings`, and prints
+    a line for every run (actual start, lag behind the scheduled time and
+    duration) and for every run that was skipped: started later than the
+    misfire grace time, or due while `max_instances` runs were still going.
+    """
+
+    _policies: dict[str, JobSettings] = attrs.field(factory=dict, init=False)
+    # Scheduled times of the submitted runs that have not started yet
+    _pending: dict[str, deque[datetime]] = attrs.field(factory=dict, init=False)
+
+    def listen(self, scheduler: BaseScheduler):
+        scheduler.add_listener(
+            self._on_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+        )
+
+    def add_job(
+        self,
+        scheduler: BaseScheduler,
+        job_id: str,
+        func: Callable[[], Awaitable[Any]],
+        policy: JobSettings,
+        **trigger_args,
+    ):
+        self._policies[job_id] = policy
+        self._pending[job_id] = deque()
+        scheduler.add_job(
+            self._wrap(job_id, func),
+            "interval",
+            id=job_id,
+            name=job_id,
+            max_instances=policy.max_instances,
+            coalesce=policy.coalesce,
+            misfire_grace_time=policy.misfire_grace_seconds or None,
+            jitter=policy.jitter_seconds or None,
+            **trigger_args,
+        )
+
+    def _on_event(self, event: JobEvent):
+        policy = self._policies.get(event.job_id)
+        if policy is None:
+            return
+
+        if event.code == EVENT_JOB_SUBMITTED:
+            self._pending[event.job_id].extend(event.scheduled_run_times)  # type: ignore
+        elif event.code == EVENT_JOB_MISSED:
+            print(
+                f"[{event.job_id}] Skipped the run due at "
+                f"{_format_time(event.scheduled_run_time)}: "  # type: ignore
+                f"more than {policy.misfire_grace_seconds}s late."
+            )
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            for run_time in event.scheduled_run_times:  # type: ignore
+                print(
+                    f"[{event.job_id}] Skipped the run due at {_format_time(run_time)}: "
+                    f"{policy.max_instances} run(s) still going."
+                )
+
+    def _scheduled_time(self, job_id: str, now: datetime) -> datetime | None:
+        pending = self._pending[job_id]
+        # Runs past the grace time are skipped without calling the job
+        grace = self._policies[job_id].misfire_grace_seconds
+        while grace and pending and (now - pending[0]).total_seconds() > grace:
+            pending.popleft()
+        return pending.popleft() if pending else None
+
+    def _wrap(
+        self, job_id: str, func: Callable[[], Awaitable[Any]]
+    ) -> Callable[[], Awaitable[None]]:
+        async def run():
+            start = datetime.now(timezone.utc)
+            begin = time.perf_counter()
+            scheduled = self._scheduled_time(job_id, start)
+            lag = ""
+            if scheduled is not None:
+                lag = f" (lag {(start - scheduled).total_seconds():.3f}s)"
+            status = "failed"
+            try:
+                await func()
+                status = "done"
+            finally:
+                print(
+                    f"[{job_id}] Started {_format_time(start)}{lag}, "
+                    f"{status} in {time.perf_counter() - begin:.2f}s."
+                )
+
+        return run
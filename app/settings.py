@@ -1,5 +1,6 @@
 from alpenstock.settings import Settings
 from pydantic import Field
+from typing import Literal
 import dotenv
 
 dotenv.load_dotenv()
@@ -37,6 +38,20 @@ class AppSettings(Settings):
         ),
     )
 
+    usage_source: Literal["declared", "size", "downloaded"] = Field(
+        default="declared",
+        description=(
+            "How the disk space of a torrent is counted against the disk quota. "
+            "'declared': the size announced by the site when the torrent was added. "
+            "'size': the size of the selected files reported by qBittorrent, "
+            "i.e., the space the torrent takes once completed. "
+            "'downloaded': the bytes qBittorrent has already downloaded, "
+            "i.e., the space the torrent takes on disk now. "
+            "The sizes are picked up when statistics are sampled, also when "
+            "switching back to 'declared'. Default is 'declared'."
+        ),
+    )
+
     daemon: "DaemonSettings" = Field(
         default_factory=lambda: DaemonSettings(),
         description="Settings related to the daemon mode behavior.",
@@ -62,6 +77,21 @@ class AppSettings(Settings):
         description=("Settings for filtering free torrents before they are added."),
     )
 
+    adding: "AddingSettings" = Field(
+        default_factory=lambda: AddingSettings(),
+        description="Settings related to adding torrents to qBittorrent.",
+    )
+
+    stats: "StatsSettings" = Field(
+        default_factory=lambda: StatsSettings(),
+        description="Settings related to recording torrent statistics.",
+    )
+
+    scoring: "ScoringSettings" = Field(
+        default_factory=lambda: ScoringSettings(),
+        description="Settings related to ranking torrents when pruning.",
+    )
+
 
 class DaemonSettings(Settings):
     add_free_torrent_interval_hours: float = Field(
@@ -72,6 +102,11 @@ class DaemonSettings(Settings):
         ),
     )
 
+    add_free_torrent_job: "JobSettings" = Field(
+        default_factory=lambda: JobSettings(misfire_grace_seconds=1800),
+        description="Scheduling policy of the job adding free torrents.",
+    )
+
     sample_stats_interval_minutes: float = Field(
         default=1.0,
         description=(
@@ -80,6 +115,217 @@ class DaemonSettings(Settings):
         ),
     )
 
+    sample_stats_job: "JobSettings" = Field(
+        default_factory=lambda: JobSettings(misfire_grace_seconds=30),
+        description="Scheduling policy of the job sampling the statistics.",
+    )
+
+    compact_stats_interval_hours: float = Field(
+        default=6.0,
+        description=(
+            "Interval in hours between compactions of old statistics into the "
+            "hourly and daily tiers. See the 'stats' section for retention. "
+            "Default is 6.0 hours."
+        ),
+    )
+
+    compact_stats_job: "JobSettings" = Field(
+        default_factory=lambda: JobSettings(misfire_grace_seconds=3600),
+        description="Scheduling policy of the job compacting the statistics.",
+    )
+
+    prune_interval_hours: float = Field(
+        default=0.0,
+        description=(
+            "Interval in hours between prunes down to the disk quota, on top of "
+            "the prune before adding torrents. Useful with usage_source "
+            "'downloaded', where the used space grows while torrents download. "
+            "A prune never runs at the same time as adding torrents. "
+            "Set to 0 to disable. Default is 0.0."
+        ),
+    )
+
+    prune_job: "JobSettings" = Field(
+        default_factory=lambda: JobSettings(misfire_grace_seconds=1800),
+        description="Scheduling policy of the prune job.",
+    )
+
+
+class JobSettings(Settings):
+    max_instances: int = Field(
+        default=1,
+        description=(
+            "Maximum number of runs of the job at the same time. A run that is "
+            "due while this many are still going is skipped, and logged. "
+            "Default is 1."
+        ),
+    )
+
+    coalesce: bool = Field(
+        default=True,
+        description=(
+            "When several runs are due at once (the previous run took longer "
+            "than the interval, or the machine was asleep), run the job once "
+            "instead of once per due run. Default is true."
+        ),
+    )
+
+    misfire_grace_seconds: int = Field(
+        default=60,
+        description=(
+            "How many seconds late a run may start. A run later than this is "
+            "skipped, and logged. Set to 0 to run however late. The default "
+            "depends on the job."
+        ),
+    )
+
+    jitter_seconds: int = Field(
+        default=0,
+        description=(
+            "Delay each run by a random number of seconds up to this, to spread "
+            "the load on the site. Keep it 0 for sampling, which assumes evenly "
+            "spaced samples. Default is 0."
+        ),
+    )
+
+
+class AddingSettings(Settings):
+    download_concurrency: int = Field(
+        default=4,
+        description=(
+            "Number of .torrent files downloaded (and parsed) at the same time. "
+            "Downloads are still rate limited by the M-Team client. Default is 4."
+        ),
+    )
+
+    add_concurrency: int = Field(
+        default=16,
+        description=(
+            "Number of torrents being added to qBittorrent and verified at the "
+            "same time. Verification polls qBittorrent once for all of them. "
+            "Default is 16."
+        ),
+    )
+
+    verify_timeout_seconds: float = Field(
+        default=20.0,
+        description=(
+            "How long to wait for qBittorrent to list a newly added torrent "
+            "before giving up on verifying it. Default is 20.0 seconds."
+        ),
+    )
+
+    torrent_cache_dir: str = Field(
+        default="torrent_cache",
+        description=(
+            "Directory where downloaded .torrent files are cached, so that "
+            "retrying or re-adding a torrent does not download it again. "
+            "Default is 'torrent_cache'."
+        ),
+    )
+
+    torrent_cache_size_mb: int = Field(
+        default=256,
+        description=(
+            "Maximum size of the .torrent file cache in MB. The least "
+            "recently used files are evicted first. "
+            "Set to 0 to disable the cache. Default is 256 MB."
+        ),
+    )
+
+    @property
+    def torrent_cache_size(self) -> int:
+        """Maximum size of the .torrent file cache in bytes."""
+        return mb_to_bytes(self.torrent_cache_size_mb)
+
+
+class StatsSettings(Settings):
+    record_on_change: bool = Field(
+        default=False,
+        description=(
+            "If true, a new statistics row is only written when the uploaded "
+            "or downloaded bytes or the peer counts of a torrent change. "
+            "Idle torrents keep their latest row up to date instead, which "
+            "keeps the database small without changing the reported numbers. "
+            "Default is false."
+        ),
+    )
+
+    heartbeat_interval_minutes: float = Field(
+        default=60.0,
+        description=(
+            "When 'record_on_change' is true, a row is still written at least "
+            "once per this interval for every torrent, even if nothing changed. "
+            "Default is 60.0 minutes."
+        ),
+    )
+
+    raw_retention_days: float = Field(
+        default=0.0,
+        description=(
+            "Raw statistics older than this many days are rolled up into hourly "
+            "buckets (first, last, min and max of every counter) and DELETED. "
+            "Reports over the compacted period then only see the hourly "
+            "buckets. Set to 0 to keep raw statistics forever (no compaction). "
+            "Default is 0."
+        ),
+    )
+
+    hourly_retention_days: float = Field(
+        default=0.0,
+        description=(
+            "Hourly buckets (and hourly transfer rollups) older than this many "
+            "days are rolled up into daily buckets and deleted. Set to 0 to "
+            "keep hourly buckets forever. Default is 0."
+        ),
+    )
+
+    daily_retention_days: float = Field(
+        default=0.0,
+        description=(
+            "Daily buckets older than this many days are deleted. "
+            "Set to 0 to keep daily buckets forever. Default is 0."
+        ),
+    )
+
+
+class ScoringSettings(Settings):
+    mode: Literal["recent", "lifetime"] = Field(
+        default="recent",
+        description=(
+            "How torrents are ranked when pruning. "
+            "'recent': by their recent upload rate and swarm demand, "
+            "weighting newer samples more (see the settings below). "
+            "'lifetime': by their lifetime ratio divided by active months. "
+            "Default is 'recent'."
+        ),
+    )
+
+    window_days: float = Field(
+        default=14.0,
+        description=(
+            "Days of statistics read for the 'recent' ranking. Should not be "
+            "longer than 'stats.raw_retention_days'. Default is 14.0 days."
+        ),
+    )
+
+    half_life_days: float = Field(
+        default=3.0,
+        description=(
+            "Half-life in days of the weight of a sample in the 'recent' "
+            "ranking. Default is 3.0 days."
+        ),
+    )
+
+    demand_weight: float = Field(
+        default=1.0,
+        description=(
+            "Weight of the swarm demand (leechers per seeder) in the 'recent' "
+            "ranking, in GiB per day of recent upload that one leecher per "
+            "seeder is worth. Default is 1.0."
+        ),
+    )
+
 
 class QBitSettings(Settings):
     api_base: str = Field(
@@ -104,6 +350,23 @@ class QBitSettings(Settings):
         ),
     )
 
+    max_connections: int = Field(
+        default=4,
+        description=(
+            "Maximum number of concurrent requests to the qBittorrent Web API. "
+            "Requests run on background threads with keep-alive connections, "
+            "so a slow Web UI does not stall the other jobs. Default is 4."
+        ),
+    )
+
+    delete_batch_size: int = Field(
+        default=50,
+        description=(
+            "Number of torrents removed by one delete request when pruning. "
+            "Default is 50."
+        ),
+    )
+
     save_to_category: str | None = Field(
         default=None,
         description=(
@@ -168,6 +431,80 @@ class MTeamSettings(Settings):
         ),
     )
 
+    rate_limit: float = Field(
+        default=2.0,
+        gt=0,
+        description=(
+            "Maximum number of M-Team API requests per second, shared by "
+            "all endpoints. Must be greater than 0. Default is 2."
+        ),
+    )
+
+    rate_burst: int = Field(
+        default=1,
+        ge=1,
+        description=(
+            "Number of requests that may go out at once after an idle "
+            "period, on top of the rate limit. Applies to the shared "
+            "budget and to the endpoint budgets below. At least 1. "
+            "Default is 1 (no burst)."
+        ),
+    )
+
+    search_rate_limit: float = Field(
+        default=0,
+        ge=0,
+        description=(
+            "Maximum number of search requests per second, within the "
+            "shared budget. Set to 0 to only use the shared budget. Default is 0."
+        ),
+    )
+
+    dl_token_rate_limit: float = Field(
+        default=0,
+        ge=0,
+        description=(
+            "Maximum number of download token requests (genDlToken) per "
+            "second, within the shared budget. M-Team limits this endpoint "
+            "more strictly than searches. "
+            "Set to 0 to only use the shared budget. Default is 0."
+        ),
+    )
+
+    download_rate_limit: float = Field(
+        default=0,
+        ge=0,
+        description=(
+            "Maximum number of .torrent file downloads per second, within "
+            "the shared budget. Set to 0 for no limit. Default is 0."
+        ),
+    )
+
+    search_modes: list[Literal["normal", "adult", "movie", "tvshow"]] = Field(
+        default=["normal", "adult", "movie", "tvshow"],
+        description=(
+            "Search modes (categories) crawled for free torrents. "
+            "All modes are crawled concurrently, within the rate limit "
+            "of the M-Team client. "
+            "Default is all modes: normal, adult, movie and tvshow."
+        ),
+    )
+
+    search_max_pages: int = Field(
+        default=10,
+        description=(
+            "Maximum number of search result pages crawled per mode. "
+            "The crawl of a mode stops earlier at the first page holding "
+            "only torrents that are already added or no longer free. "
+            "Default is 10."
+        ),
+    )
+
+    search_page_size: int = Field(
+        default=100,
+        description="Number of torrents per search result page. Default is 100.",
+    )
+
 
 class FilterSettings(Settings):
     max_torrent_size_mb: int = Field(
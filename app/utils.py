@@ -1,4 +1,5 @@
 import humanize
+from pt_stats.bencode import scan_torrent
 import functools
 from datetime import datetime, timezone
 
@@ -14,3 +15,9 @@ def shorten(text: str, max_length: int) -> str:
 
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
+
+
+def read_torrent_info(torrent_meta: bytes) -> tuple[str, list[tuple[str, int]]]:
+    """Return the infohash and the (path, size) of the files of a .torrent file."""
+    summary = scan_torrent(torrent_meta)
+    return summary.infohash, summary.files
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark: getting the infohash (and the file list) of a .torrent
+file with `torf.Torrent.read_stream` versus `pt_stats.bencode.scan_torrent`.
+
+The torrents are generated to look like large real-world ones: a
+multi-file torrent of many episodes, and a single-file
+torrent with a small piece size (so a long piece list).
+
+    python benchmarks/bench_bencode.py --files 2000 --size-gb 80
+"""
+
+import hashlib
+import os
+import time
+
+import torf
+from cyclopts import App
+
+from pt_stats.bencode import scan_torrent
+
+cli = App("bench-bencode")
+
+
+def bencode(value) -> bytes:
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(v) for v in value) + b"e"
+    if isinstance(value, dict):
+        items = sorted(
+            (k.encode() if isinstance(k, str) else k, v) for k, v in value.items()
+        )
+        return b"d" + b"".join(bencode(k) + bencode(v) for k, v in items) + b"e"
+    raise TypeError(type(value))
+
+
+def make_torrent(total_size: int, n_files: int, piece_length: int) -> bytes:
+    base, extra = divmod(total_size, n_files)
+    sizes = [base + (1 if i < extra else 0) for i in range(n_files)]
+    info: dict = {
+        "name": "Some.Show.S01-S08.2160p.WEB-DL",
+        "piece length": piece_length,
+        # Random bytes, the content of the hashes does not matter here
+        "pieces": os.urandom(20 * -(-total_size // piece_length)),
+        "private": 1,
+        "source": "[example.org] Example",
+    }
+    if n_files == 1:
+        info["length"] = total_size
+    else:
+        info["files"] = [
+            {
+                "length": size,
+                "path": [f"Season.{i // 100 + 1:02d}", f"Some.Show.E{i:04d}.mkv"],
+            }
+            for i, size in enumerate(sizes)
+        ]
+    return bencode(
+        {
+            "announce": "https://tracker.example.org/announce?passkey=0123456789abcdef",
+            "comment": "generated for benchmarking",
+            "created by": "bench_bencode",
+            "creation date": 1767225600,
+            "info": info,
+        }
+    )
+
+
+def with_torf(data: bytes) -> tuple[str, int]:
+    torrent = torf.Torrent.read_stream(data)
+    return torrent.infohash, len(torrent.files)
+
+
+def with_scanner(data: bytes) -> tuple[str, int]:
+    summary = scan_torrent(data)
+    return summary.infohash, summary.file_count
+
+
+def bencode_info_span(data: bytes) -> bytes:
+    # The generated torrents end with the info dictionary (keys are
+    # sorted), followed by the end of the outer dictionary.
+    return data[data.index(b"4:infod") + len(b"4:info") : -1]
+
+
+@cli.default
+def main(files: int = 2000, size_gb: int = 80, rounds: int = 5):
+    """Parse generated torrents `rounds` times with both parsers.
+
+    Parameters
+    ----------
+    files: int
+        Number of files of the multi-file torrent.
+    size_gb: int
+        Total content size of each torrent, in GiB.
+    rounds: int
+        Number of parses of each torrent with each parser.
+    """
+    total_size = size_gb * 2**30
+    torrents = {
+        f"{files} files, 4 MiB pieces": make_torrent(total_size, files, 4 * 2**20),
+        "1 file, 256 KiB pieces": make_torrent(total_size, 1, 256 * 2**10),
+    }
+
+    for label, data in torrents.items():
+        expected = hashlib.sha1(bencode_info_span(data)).hexdigest()
+        results = {}
+        for name, fn in (("torf", with_torf), ("scan_torrent", with_scanner)):
+            elapsed = []
+            for _ in range(rounds):
+                begin = time.perf_counter()
+                infohash, n_files = fn(data)
+                elapsed.append(time.perf_counter() - begin)
+            assert infohash == expected, f"{name} returned a wrong infohash"
+            results[name] = min(elapsed)
+
+        print(f"{label} ({len(data) / 2**20:.1f} MiB .torrent), best of {rounds}:")
+        for name, best in results.items():
+            print(f"  {name:<12} {best * 1000:8.2f} ms")
+        print(f"  speedup      {results['torf'] / results['scan_torrent']:8.1f}x")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: inserting one sampling tick of `TorrentStats` rows with
+`TorrentStats.create` per row versus the batched `insert_torrent_stats`.
+
+    python benchmarks/bench_stats_insert.py --torrents 10000
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from cyclopts import App
+
+import pt_stats.db as db
+import pt_stats.db.models as db_schemas
+
+cli = App("bench-stats-insert")
+
+
+def setup_db(path: str, n_torrents: int) -> list[int]:
+    db.initialize(path)
+    db.conn.create_tables(
+        [db_schemas.Sites, db_schemas.Torrents, db_schemas.TorrentStats]
+    )
+    site = db_schemas.Sites.create(name="Bench", url="https://example.com/")
+    with db.conn.atomic():
+        db_schemas.Torrents.insert_many(
+            [
+                (f"{i:040x}", f"torrent-{i}", site.id, str(i), f"/detail/{i}", 2**30)
+                for i in range(n_torrents)
+            ],
+            fields=[
+                db_schemas.Torrents.torrent_hash,
+                db_schemas.Torrents.name,
+                db_schemas.Torrents.site,
+                db_schemas.Torrents.sitewise_id,
+                db_schemas.Torrents.url,
+                db_schemas.Torrents.size_bytes,
+            ],
+        ).execute()
+    return [t.id for t in db_schemas.Torrents.select(db_schemas.Torrents.id)]
+
+
+def make_rows(torrent_ids: list[int], sample_time: datetime) -> list[db.StatsRow]:
+    return [
+        db.StatsRow(tid, sample_time, 1, 10, 2, 20, tid * 1024, tid * 512)
+        for tid in torrent_ids
+    ]
+
+
+def old_path(torrent_ids: list[int], sample_time: datetime):
+    with db.conn.atomic():
+        for row in make_rows(torrent_ids, sample_time):
+            db_schemas.TorrentStats.create(
+                torrent=row.torrent_id,
+                recorded_time=row.recorded_time,
+                connected_seeders=row.connected_seeders,
+                swarm_seeders=row.swarm_seeders,
+                connected_leechers=row.connected_leechers,
+                swarm_leechers=row.swarm_leechers,
+                uploaded_bytes=row.uploaded_bytes,
+                downloaded_bytes=row.downloaded_bytes,
+            )
+
+
+def new_path(torrent_ids: list[int], sample_time: datetime):
+    db.insert_torrent_stats(make_rows(torrent_ids, sample_time), ignore_conflicts=True)
+
+
+@cli.default
+def main(torrents: int = 10_000, rounds: int = 5):
+    """Run both insert paths `rounds` times over `torrents` torrents.
+
+    Parameters
+    ----------
+    torrents: int
+        Number of torrents sampled per tick.
+    rounds: int
+        Number of sampling ticks inserted with each path.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        torrent_ids = setup_db(os.path.join(tmp, "bench.db"), torrents)
+        t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+        results = {}
+        for name, fn, offset in (
+            ("create()", old_path, 0),
+            ("insert_many", new_path, rounds),
+        ):
+            elapsed = []
+            for r in range(rounds):
+                sample_time = t0 + timedelta(minutes=offset + r)
+                begin = time.perf_counter()
+                fn(torrent_ids, sample_time)
+                elapsed.append(time.perf_counter() - begin)
+            results[name] = min(elapsed)
+
+        db.close()
+
+    print(f"{torrents} torrents per tick, best of {rounds} ticks:")
+    for name, best in results.items():
+        print(f"  {name:<12} {best * 1000:8.1f} ms  ({torrents / best:,.0f} rows/s)")
+    print(f"  speedup      {results['create()'] / results['insert_many']:8.1f}x")
+
+
+if __name__ == "__main__":
+    cli()
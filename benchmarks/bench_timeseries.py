@@ -0,0 +1,152 @@
+"""
+Benchmark: `torrent_timeseries` (one grouped query, NumPy post-processing)
+versus one `transfer_deltas_sql` query per bucket. The grouped query is
+not the faster of the two over many samples (see `timeseries.py`); the
+per-bucket totals are checked against each other.
+
+Generates `--rows` samples every `--interval` seconds for `--torrents`
+torrents, with the same counters as `bench_transfer_deltas.py` (one in
+fifty torrents is re-added halfway):
+
+    python benchmarks/bench_timeseries.py --rows 10000000 --path /tmp/series.db
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from cyclopts import App
+
+import pt_stats.db as db
+import pt_stats.db.models as db_schemas
+from pt_stats.db.queries import transfer_deltas_sql
+from pt_stats.db.schema import TABLES
+from pt_stats.db.timeseries import torrent_timeseries
+from bench_transfer_deltas import T0, fill
+
+cli = App("bench-timeseries")
+
+
+def per_bucket_deltas(
+    start: datetime, end: datetime, bucket: timedelta
+) -> tuple[float, np.ndarray]:
+    """Total uploaded bytes per bucket, one query per bucket."""
+    size = int(bucket.total_seconds())
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    origin = start_ts // size * size
+    bounds = list(range(origin, end_ts, size))
+    totals = []
+    begin = time.perf_counter()
+    for k, bucket_start in enumerate(bounds):
+        # The last bucket also holds a sample exactly at the end
+        bucket_end = end_ts if k == len(bounds) - 1 else bucket_start + size - 1
+        sql, params = transfer_deltas_sql(
+            datetime.fromtimestamp(max(bucket_start, start_ts), tz=timezone.utc),
+            datetime.fromtimestamp(bucket_end, tz=timezone.utc),
+        )
+        (total,) = db.conn.execute_sql(
+            f"SELECT COALESCE(SUM(uploaded_delta), 0) FROM ({sql})", params
+        ).fetchone()
+        totals.append(total)
+    return time.perf_counter() - begin, np.array(totals, dtype=np.float64)
+
+
+@cli.default
+def main(
+    rows: int = 10_000_000,
+    torrents: int = 2000,
+    interval: int = 300,
+    path: str | None = None,
+):
+    """Time the series over the whole period, the last day and 10 torrents.
+
+    Parameters
+    ----------
+    rows: int
+        Number of synthetic `TorrentStats` rows.
+    torrents: int
+        Number of torrents.
+    interval: int
+        Seconds between two samples of a torrent.
+    path: str | None
+        Database file to create (or reuse if it already holds samples).
+        A temporary file by default.
+    """
+    tmp = None
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "series.db")
+
+    n_samples = rows // torrents
+    end = datetime.fromtimestamp(T0 + (n_samples - 1) * interval, tz=timezone.utc)
+    full_start = datetime.fromtimestamp(T0, tz=timezone.utc)
+
+    db.initialize(path)
+    db.conn.create_tables(TABLES)
+    if db_schemas.TorrentStats.select().limit(1).count() == 0:
+        print(f"Filling {n_samples * torrents:,} samples...")
+        begin = time.perf_counter()
+        fill(torrents, n_samples, interval)
+        print(f"Filled in {time.perf_counter() - begin:.1f}s")
+    db.create_schema()
+
+    # A range ending on a bucket boundary
+    hour_end = datetime.fromtimestamp(
+        int(end.timestamp()) // 3600 * 3600, tz=timezone.utc
+    )
+    cases = {
+        "all torrents, whole period, daily": (
+            full_start,
+            end,
+            timedelta(days=1),
+            None,
+        ),
+        "all torrents, whole period, hourly": (
+            full_start,
+            end,
+            timedelta(hours=1),
+            None,
+        ),
+        "all torrents, last day, hourly": (
+            end - timedelta(days=1),
+            end,
+            timedelta(hours=1),
+            None,
+        ),
+        "all torrents, last day to the hour, hourly": (
+            hour_end - timedelta(days=1),
+            hour_end,
+            timedelta(hours=1),
+            None,
+        ),
+        "10 torrents, whole period, hourly": (
+            full_start,
+            end,
+            timedelta(hours=1),
+            list(range(1, 11)),
+        ),
+    }
+    for label, (start, stop, bucket, ids) in cases.items():
+        begin = time.perf_counter()
+        series = torrent_timeseries(start, stop, bucket, ids)
+        elapsed = time.perf_counter() - begin
+        shape = series.uploaded.shape
+        print(f"{label}:")
+        print(f"  time series   {elapsed * 1000:10.1f} ms  {shape[0]}x{shape[1]}")
+
+        if ids is None and bucket == timedelta(hours=1):
+            # The old way, checked against the new one
+            old_time, old = per_bucket_deltas(start, stop, bucket)
+            new = series.uploaded.sum(axis=0)
+            assert np.array_equal(old, new), "wrong bucket totals"
+            print(f"  per bucket    {old_time * 1000:10.1f} ms")
+
+    db.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    cli()
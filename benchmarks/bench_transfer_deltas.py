@@ -0,0 +1,220 @@
+"""
+Benchmark: transfer deltas with the boundary CTE (MIN/MAX of the range,
+then the start and end samples joined back) versus the single-pass
+`transfer_deltas_sql` (window over consecutive samples, one aggregation)
+and `rollup_transfer_deltas_sql` (hourly/daily rollups, samples for the
+partial hours at the ends).
+
+Generates `--days` of samples every `--interval` seconds for `--torrents`
+torrents. One in fifty torrents is re-added halfway, which resets its
+counters. The default is a year of 5-minute samples for 2k torrents
+(210M rows, several GB), so try smaller sizes first:
+
+    python benchmarks/bench_transfer_deltas.py --days 30 --path /tmp/deltas.db
+
+With `--compact`, the samples are first compacted (raw for 30 days, then
+hourly for a year), as a long-running install with compaction enabled
+would hold them.
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from cyclopts import App
+
+import pt_stats.db as db
+import pt_stats.db.models as db_schemas
+from pt_stats.db.compaction import compact_torrent_stats, tiered_samples_sql
+from pt_stats.db.queries import rollup_transfer_deltas_sql, transfer_deltas_sql
+from pt_stats.db.schema import TABLES
+
+cli = App("bench-transfer-deltas")
+
+T0 = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+RESET_EVERY = 50  # every this many torrents, one is re-added halfway
+
+
+def boundary_sql(start: datetime, end: datetime) -> tuple[str, list]:
+    """The previous implementation of `transfer_deltas_sql`."""
+    samples_sql, params = tiered_samples_sql(start, end)
+    sql = f"""
+    WITH samples AS ({samples_sql}
+    ),
+    boundary AS (
+        SELECT
+            torrent_id,
+            MIN(recorded_time) AS min_ts,
+            MAX(recorded_time) AS max_ts
+        FROM samples
+        GROUP BY torrent_id
+    )
+    SELECT
+        t.*,
+        end_stats.uploaded_bytes - start_stats.uploaded_bytes
+            AS uploaded_delta,
+        end_stats.downloaded_bytes - start_stats.downloaded_bytes
+            AS downloaded_delta
+    FROM torrents t
+    JOIN boundary ON t.id = boundary.torrent_id
+    JOIN samples start_stats
+        ON start_stats.torrent_id = boundary.torrent_id
+        AND start_stats.recorded_time = boundary.min_ts
+    JOIN samples end_stats
+        ON end_stats.torrent_id = boundary.torrent_id
+        AND end_stats.recorded_time = boundary.max_ts
+    """
+    return sql, params
+
+
+def fill(n_torrents: int, n_samples: int, interval: int):
+    """
+    Torrent `i` uploads `i` KiB and downloads 1 KiB per sample. Torrents
+    with `i % RESET_EVERY == 0` restart from 0 at sample `n_samples // 2`.
+    """
+    site = db_schemas.Sites.create(name="Bench", url="https://example.com/")
+    half = n_samples // 2
+    # Without the secondary indexes while filling; recreated afterwards
+    for index in db.conn.get_indexes("torrentstats"):
+        db.conn.execute_sql(f'DROP INDEX "{index.name}"')
+    with db.conn.atomic():
+        db.conn.execute_sql(
+            """
+            WITH RECURSIVE seq(i) AS (
+                SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?
+            )
+            INSERT INTO torrents (
+                id, torrent_hash, name, site_id, sitewise_id, url,
+                size_bytes, added_time
+            )
+            SELECT
+                i, printf('%040x', i), 'torrent-' || i, ?, CAST(i AS TEXT),
+                '/detail/' || i, 1073741824, ?
+            FROM seq
+            """,
+            (n_torrents, site.id, T0),
+        )
+        db.conn.execute_sql(
+            """
+            WITH RECURSIVE seq(k) AS (
+                SELECT 0 UNION ALL SELECT k + 1 FROM seq WHERE k < ?
+            )
+            INSERT INTO torrentstats (
+                torrent_id, recorded_time,
+                connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+                uploaded_bytes, downloaded_bytes
+            )
+            SELECT
+                t.id, ? + seq.k * ?, 1, 10, 2, 20,
+                (CASE WHEN t.id % ? = 0 AND seq.k >= ? THEN seq.k - ? ELSE seq.k END)
+                    * t.id * 1024,
+                (CASE WHEN t.id % ? = 0 AND seq.k >= ? THEN seq.k - ? ELSE seq.k END)
+                    * 1024
+            FROM seq CROSS JOIN torrents t
+            ORDER BY seq.k, t.id
+            """,
+            (
+                n_samples - 1,
+                T0,
+                interval,
+                RESET_EVERY,
+                half,
+                half,
+                RESET_EVERY,
+                half,
+                half,
+            ),
+        )
+    db.conn.create_tables(TABLES)
+
+
+def timed(sql_and_params: tuple[str, list]) -> tuple[float, dict[int, tuple]]:
+    sql, params = sql_and_params
+    begin = time.perf_counter()
+    rows = db.conn.execute_sql(
+        f"SELECT id, uploaded_delta, downloaded_delta FROM ({sql})", params
+    ).fetchall()
+    return time.perf_counter() - begin, {tid: (up, down) for tid, up, down in rows}
+
+
+@cli.default
+def main(
+    torrents: int = 2000,
+    days: float = 365.0,
+    interval: int = 300,
+    path: str | None = None,
+    compact: bool = False,
+):
+    """Compare the implementations over the last day, month and year.
+
+    Parameters
+    ----------
+    torrents: int
+        Number of torrents.
+    days: float
+        Length of the sampled period, in days.
+    interval: int
+        Seconds between two samples of a torrent.
+    path: str | None
+        Database file to create (or reuse if it already holds samples).
+        A temporary file by default.
+    compact: bool
+        Compact the samples first (raw for 30 days, hourly for a year).
+    """
+    tmp = None
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "deltas.db")
+
+    n_samples = int(days * 86400 // interval)
+    end = datetime.fromtimestamp(T0 + (n_samples - 1) * interval, tz=timezone.utc)
+
+    db.initialize(path)
+    db.conn.create_tables(TABLES)
+    if db_schemas.TorrentStats.select().limit(1).count() == 0:
+        print(f"Filling {n_samples * torrents:,} samples...")
+        begin = time.perf_counter()
+        fill(torrents, n_samples, interval)
+        print(f"Filled in {time.perf_counter() - begin:.1f}s")
+    db.create_schema()
+    if compact:
+        summary = compact_torrent_stats(
+            end,
+            raw_retention=timedelta(days=30),
+            hourly_retention=timedelta(days=365),
+            daily_retention=None,
+        )
+        print(f"Compacted: {summary}")
+
+    spans = {1: "last day", 30: "last 30 days", days: f"last {days:g} days"}
+    for span_days, label in spans.items():
+        if span_days > days:
+            continue
+        span = timedelta(days=span_days)
+        start = end - span
+        # The step into the range counts, so the boundary CTE starts one
+        # sample earlier
+        old_time, old = timed(boundary_sql(start - timedelta(seconds=interval), end))
+        new_time, new = timed(transfer_deltas_sql(start, end))
+        rollup_time, rollup = timed(rollup_transfer_deltas_sql(start, end))
+
+        assert old.keys() == new.keys(), "not the same torrents"
+        assert all(up >= 0 and down >= 0 for up, down in new.values())
+        mismatched = [tid for tid in new if old[tid] != new[tid]]
+        assert all(tid % RESET_EVERY == 0 for tid in mismatched), "wrong deltas"
+        assert rollup == {tid: d for tid, d in new.items() if d != (0, 0)}
+
+        print(f"{label}:")
+        print(f"  boundary CTE  {old_time * 1000:10.1f} ms")
+        print(f"  single pass   {new_time * 1000:10.1f} ms")
+        print(f"  rollups       {rollup_time * 1000:10.1f} ms")
+        print(f"  reset torrents with differing deltas: {len(mismatched)}")
+
+    db.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    cli()
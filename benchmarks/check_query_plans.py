@@ -0,0 +1,223 @@
+"""
+Query plan check: run `EXPLAIN QUERY PLAN` on the hot queries against a
+synthetic database and exit with status 1 if any of them scans one of the
+sample tables, which grow with time. Scans of the per-torrent tables are
+fine (and are what the planner picks once ANALYZE shows that most torrents
+are not deleted).
+
+    python benchmarks/check_query_plans.py --rows 10000000
+
+The database is kept at `--path` (if given) and reused on the next run
+when it already holds the requested number of rows.
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from cyclopts import App
+
+import pt_stats.db as db
+import pt_stats.db.queries as db_queries
+import pt_stats.db.models as db_schemas
+from pt_stats.db import timeseries
+from pt_stats.db.schema import TABLES
+from pt_stats.db.scoring import SELECT_RECENT_SAMPLES
+
+cli = App("check-query-plans")
+
+SAMPLE_INTERVAL = 300  # seconds between two samples of a torrent
+T0 = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+
+# Tables that grow with every sample and must never be scanned whole,
+# not even through an index
+SAMPLE_TABLES = {
+    "torrentstats",
+    "torrentstats_hourly",
+    "torrentstats_daily",
+    "transfer_rollups",
+}
+
+
+def fill(n_rows: int, n_torrents: int):
+    """
+    Fill the tables with `n_torrents` torrents (one in ten deleted) and
+    `n_rows` samples, 5 minutes apart. Runs before the triggers exist,
+    so the trigger-maintained tables are filled once afterwards.
+    """
+    per_torrent = n_rows // n_torrents
+    site = db_schemas.Sites.create(name="Bench", url="https://example.com/")
+    with db.conn.atomic():
+        db.conn.execute_sql(
+            """
+            WITH RECURSIVE seq(i) AS (
+                SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?
+            )
+            INSERT INTO torrents (
+                id, torrent_hash, name, site_id, sitewise_id, url,
+                size_bytes, added_time, delete_time
+            )
+            SELECT
+                i, printf('%040x', i), 'torrent-' || i, ?, CAST(i AS TEXT),
+                '/detail/' || i, (i % 50 + 1) * 1073741824, ?,
+                CASE WHEN i % 10 = 0 THEN ? END
+            FROM seq
+            """,
+            (n_torrents, site.id, T0, T0 + per_torrent * SAMPLE_INTERVAL),
+        )
+        db.conn.execute_sql(
+            """
+            WITH RECURSIVE seq(i) AS (
+                SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < ?
+            )
+            INSERT INTO torrentstats (
+                torrent_id, recorded_time,
+                connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+                uploaded_bytes, downloaded_bytes
+            )
+            SELECT
+                i % ? + 1, ? + (i / ?) * ?,
+                1, 10, 2, 20,
+                (i / ?) * (i % 97) * 1024, 1073741824
+            FROM seq
+            """,
+            (
+                per_torrent * n_torrents - 1,
+                n_torrents,
+                T0,
+                n_torrents,
+                SAMPLE_INTERVAL,
+                n_torrents,
+            ),
+        )
+        db.conn.execute_sql(
+            "INSERT INTO torrent_scores "
+            "(torrent_id, computed_time, upload_rate, demand, score) "
+            "SELECT id, ?, 0, 0, 0 FROM torrents WHERE delete_time IS NULL",
+            (T0,),
+        )
+
+
+def hot_queries(end: int) -> dict[str, tuple[str, list]]:
+    now = datetime.fromtimestamp(end, tz=timezone.utc)
+    day_ago = now - timedelta(days=1)
+    to_ts = db_schemas.TorrentStats.recorded_time.db_value
+
+    tail_update = db_schemas.TorrentStats.update(recorded_time=to_ts(now)).where(
+        (db_schemas.TorrentStats.recorded_time == to_ts(day_ago))
+        & (db_schemas.TorrentStats.torrent.in_(list(range(1, 501))))
+    )
+    return {
+        "sample: alive torrents": db_queries.alive_torrents_with_usage().sql(),
+        "sample: extend idle tails": tail_update.sql(),
+        "prune: candidates (lifetime)": db_queries.prune_candidates(False).sql(),
+        "prune: candidates (recent)": db_queries.prune_candidates(True).sql(),
+        "prune: recent samples": (
+            SELECT_RECENT_SAMPLES,
+            [to_ts(now - timedelta(days=14)), to_ts(now)],
+        ),
+        "report: transfer deltas": db_queries.transfer_deltas_sql(day_ago, now),
+        "report: transfer rollups": db_queries.rollup_transfer_deltas_sql(
+            now - timedelta(days=30, minutes=17), now
+        ),
+        "report: timeline (some torrents)": timeseries.bucket_rows_sql(
+            day_ago, now, 3600, list(range(1, 11))
+        ),
+    }
+
+
+def alias_map(sql_texts: list[str], tables: set[str]) -> dict[str, str]:
+    """Map the names a plan may show (tables and their aliases) to tables."""
+    names = {t: t for t in tables}
+    pattern = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+    for sql in sql_texts:
+        for table, alias in pattern.findall(sql.replace('"', "")):
+            if table in tables and alias and alias.upper() not in {"ON", "WHERE"}:
+                names[alias] = table
+    return names
+
+
+def full_scans(plan: list[str], names: dict[str, str]) -> list[str]:
+    bad = []
+    for detail in plan:
+        m = re.match(r"SCAN (\w+)", detail)
+        # Searches, CTEs and subqueries are skipped
+        if m is not None and names.get(m.group(1)) in SAMPLE_TABLES:
+            bad.append(detail)
+    return bad
+
+
+@cli.default
+def main(
+    rows: int = 10_000_000,
+    torrents: int = 2000,
+    path: str | None = None,
+    analyze: bool = False,
+):
+    """Check the query plans of the hot queries.
+
+    Parameters
+    ----------
+    rows: int
+        Number of synthetic `TorrentStats` rows.
+    torrents: int
+        Number of synthetic torrents.
+    path: str | None
+        Database file to create (or reuse). A temporary file by default.
+    analyze: bool
+        Run ANALYZE first, so the planner uses table statistics.
+    """
+    tmp = None
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "plans.db")
+
+    db.initialize(path)
+    db.conn.create_tables(TABLES)
+    existing = db_schemas.TorrentStats.select().count()
+    if existing == 0:
+        begin = time.perf_counter()
+        fill(rows, torrents)
+        print(f"Filled {rows:,} rows in {time.perf_counter() - begin:.1f}s")
+    elif existing != rows // torrents * torrents:
+        print(f"{path} holds {existing:,} rows, remove it first.", file=sys.stderr)
+        sys.exit(2)
+    db.create_schema()
+    if analyze:
+        db.conn.execute_sql("ANALYZE")
+
+    end = T0 + (rows // torrents) * SAMPLE_INTERVAL
+    tables = set(db.conn.get_tables())
+    views = [
+        sql
+        for (sql,) in db.conn.execute_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'view'"
+        )
+    ]
+
+    failed = 0
+    for name, (sql, params) in hot_queries(end).items():
+        names = alias_map([sql, *views], tables)
+        plan = [
+            row[3] for row in db.conn.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+        bad = full_scans(plan, names)
+        failed += bool(bad)
+        print(f"{'FAIL' if bad else 'ok'}  {name}")
+        for detail in plan:
+            print(f"      {'!! ' if detail in bad else ''}{detail}")
+
+    db.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+    if failed:
+        print(f"{failed} queries scan a sample table.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,108 @@
+"""
+Transfer rollup check: compact a synthetic database, then compare the
+transfer deltas read from the rollups (`rollup_transfer_deltas_sql`)
+with the ones computed from the samples (`transfer_deltas_sql`) over
+ranges before, across and after the retention cutoffs. Exits with
+status 1 on a mismatch.
+
+Uses the samples of `bench_transfer_deltas.py`. Torrents re-added
+halfway are left out of the comparison: a reset within a compacted
+bucket is only seen by the rollups.
+
+    python benchmarks/check_transfer_rollups.py --days 60
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from cyclopts import App
+
+import pt_stats.db as db
+from pt_stats.db.compaction import compact_torrent_stats
+from pt_stats.db.queries import rollup_transfer_deltas_sql, transfer_deltas_sql
+from pt_stats.db.schema import TABLES
+from bench_transfer_deltas import RESET_EVERY, T0, fill, timed
+
+cli = App("check-transfer-rollups")
+
+
+@cli.default
+def main(
+    torrents: int = 100,
+    days: int = 60,
+    interval: int = 300,
+    raw_days: int = 7,
+    hourly_days: int = 21,
+):
+    """Compare the rollup and sample transfer deltas after a compaction.
+
+    Parameters
+    ----------
+    torrents: int
+        Number of torrents.
+    days: int
+        Length of the sampled period, in days.
+    interval: int
+        Seconds between two samples of a torrent.
+    raw_days: int
+        Raw retention of the compaction, in days.
+    hourly_days: int
+        Hourly retention of the compaction, in days.
+    """
+    tmp = tempfile.TemporaryDirectory()
+    db.initialize(os.path.join(tmp.name, "rollups.db"))
+    db.conn.create_tables(TABLES)
+    n_samples = days * 86400 // interval
+    fill(torrents, n_samples, interval)
+    db.create_schema()
+
+    end = datetime.fromtimestamp(T0 + (n_samples - 1) * interval, tz=timezone.utc)
+    summary = compact_torrent_stats(
+        end,
+        raw_retention=timedelta(days=raw_days),
+        hourly_retention=timedelta(days=hourly_days),
+        daily_retention=None,
+    )
+    print(f"Compacted: {summary}")
+
+    # (days before the end) for the start and end of each range, unaligned
+    ranges = {
+        "older than the hourly retention": (days - 3.3, hourly_days + 2.6),
+        "within a day, before the hourly retention": (
+            hourly_days + 5.3,
+            hourly_days + 5.1,
+        ),
+        "across the hourly retention cutoff": (hourly_days + 4.7, hourly_days - 3.2),
+        "across the raw retention cutoff": (raw_days + 2.4, raw_days - 1.9),
+        "the whole period": (days, 0),
+    }
+    failed = 0
+    for label, (start_days, end_days) in ranges.items():
+        start = end - timedelta(days=start_days)
+        stop = end - timedelta(days=end_days)
+        _, samples = timed(transfer_deltas_sql(start, stop))
+        _, rollups = timed(rollup_transfer_deltas_sql(start, stop))
+        mismatched = [
+            tid
+            for tid in samples.keys() | rollups.keys()
+            if tid % RESET_EVERY != 0
+            and rollups.get(tid, (0, 0)) != samples.get(tid, (0, 0))
+        ]
+        failed += bool(mismatched)
+        total = sum(up for up, _ in rollups.values())
+        print(f"{'FAIL' if mismatched else 'ok'}  {label}: {total:,} bytes uploaded")
+        for tid in mismatched[:5]:
+            print(f"      torrent {tid}: {rollups.get(tid)} != {samples.get(tid)}")
+
+    db.close()
+    tmp.cleanup()
+
+    if failed:
+        print(f"{failed} ranges do not match.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,228 @@
+"""
+Minimal bencode scanner for .torrent files.
+
+Only the fields needed to add a torrent are decoded: the infohash, the
+name and the file list. Everything else, the piece hashes above all, is
+skipped by its length prefix without building Python objects, and the
+infohash is the SHA-1 of the `info` dictionary's byte span in the input.
+"""
+
+import hashlib
+from typing import NamedTuple
+
+
+class BencodeError(ValueError):
+    pass
+
+
+class TorrentSummary(NamedTuple):
+    infohash: str  # hex SHA-1 of the info dictionary (v1)
+    name: str
+    piece_length: int
+    piece_count: int
+    files: list[tuple[str, int]]  # (path, size), paths start with the name
+
+    @property
+    def total_size(self) -> int:
+        return sum(size for _, size in self.files)
+
+    @property
+    def file_count(self) -> int:
+        return len(self.files)
+
+
+def _read_int(data: bytes, i: int) -> tuple[int, int]:
+    """Read `i<digits>e` at `i`, return the value and the next position."""
+    end = data.find(b"e", i + 1)
+    if end < 0:
+        raise BencodeError(f"Unterminated integer at {i}")
+    try:
+        return int(data[i + 1 : end]), end + 1
+    except ValueError:
+        raise BencodeError(f"Invalid integer at {i}") from None
+
+
+def _string_span(data: bytes, i: int) -> tuple[int, int]:
+    """Locate `<length>:<bytes>` at `i`, return the span of the bytes."""
+    colon = data.find(b":", i)
+    if colon < 0:
+        raise BencodeError(f"Unterminated string length at {i}")
+    try:
+        length = int(data[i:colon])
+    except ValueError:
+        raise BencodeError(f"Invalid string length at {i}") from None
+    start, end = colon + 1, colon + 1 + length
+    if length < 0 or end > len(data):
+        raise BencodeError(f"String at {i} runs past the end of the data")
+    return start, end
+
+
+def _read_string(data: bytes, i: int) -> tuple[bytes, int]:
+    start, end = _string_span(data, i)
+    return data[start:end], end
+
+
+def _skip(data: bytes, i: int) -> int:
+    """Return the position right after the value at `i`."""
+    depth = 0
+    while True:
+        if i >= len(data):
+            raise BencodeError("Unexpected end of data")
+        c = data[i]
+        if c == 0x69:  # 'i'
+            i = data.find(b"e", i + 1)
+            if i < 0:
+                raise BencodeError("Unterminated integer")
+            i += 1
+        elif c == 0x6C or c == 0x64:  # 'l', 'd'
+            depth += 1
+            i += 1
+        elif c == 0x65:  # 'e'
+            depth -= 1
+            i += 1
+        else:
+            i = _string_span(data, i)[1]
+
+        if depth == 0:
+            return i
+        if depth < 0:
+            raise BencodeError(f"Unexpected end marker at {i - 1}")
+
+
+def _walk_dict(data: bytes, i: int, handlers: dict) -> int:
+    """
+    Walk the dictionary at `i`, calling `handlers[key](position)` for the
+    wanted keys and skipping the other values. A handler returns the
+    position after its value. Returns the position after the dictionary.
+    """
+    if data[i : i + 1] != b"d":
+        raise BencodeError(f"Expected a dictionary at {i}")
+    i += 1
+    while data[i : i + 1] != b"e":
+        if i >= len(data):
+            raise BencodeError("Unterminated dictionary")
+        key, i = _read_string(data, i)
+        handler = handlers.get(key)
+        i = handler(i) if handler is not None else _skip(data, i)
+    return i + 1
+
+
+def _read_list(data: bytes, i: int, read_item) -> tuple[list, int]:
+    if data[i : i + 1] != b"l":
+        raise BencodeError(f"Expected a list at {i}")
+    i += 1
+    items = []
+    while data[i : i + 1] != b"e":
+        if i >= len(data):
+            raise BencodeError("Unterminated list")
+        item, i = read_item(data, i)
+        items.append(item)
+    return items, i + 1
+
+
+def _decode_path(parts: list[bytes]) -> str:
+    return "/".join(p.decode("utf-8", errors="replace") for p in parts)
+
+
+def _read_file_entry(data: bytes, i: int) -> tuple[tuple[str, int], int]:
+    entry: dict = {}
+
+    def on_length(pos):
+        entry["length"], end = _read_int(data, pos)
+        return end
+
+    def on_path(pos):
+        entry["path"], end = _read_list(data, pos, _read_string)
+        return end
+
+    end = _walk_dict(data, i, {b"length": on_length, b"path": on_path})
+    if "length" not in entry or not entry.get("path"):
+        raise BencodeError(f"Incomplete file entry at {i}")
+    return (_decode_path(entry["path"]), entry["length"]), end
+
+
+def scan_torrent(data: bytes) -> TorrentSummary:
+    """
+    Scan a v1 (or hybrid) .torrent file.
+
+    Raises `BencodeError` if the data is not a well formed torrent, or
+    if the piece hashes do not match the total size of the files.
+    """
+    info: dict = {}
+    span: list[int] = []
+
+    def on_name(pos):
+        name, end = _read_string(data, pos)
+        info["name"] = name.decode("utf-8", errors="replace")
+        return end
+
+    def on_length(pos):
+        info["length"], end = _read_int(data, pos)
+        return end
+
+    def on_piece_length(pos):
+        info["piece_length"], end = _read_int(data, pos)
+        return end
+
+    def on_pieces(pos):
+        start, end = _string_span(data, pos)
+        info["pieces_bytes"] = end - start
+        return end
+
+    def on_files(pos):
+        info["files"], end = _read_list(data, pos, _read_file_entry)
+        return end
+
+    def on_info(pos):
+        end = _walk_dict(
+            data,
+            pos,
+            {
+                b"name": on_name,
+                b"length": on_length,
+                b"piece length": on_piece_length,
+                b"pieces": on_pieces,
+                b"files": on_files,
+            },
+        )
+        span[:] = [pos, end]
+        return end
+
+    _walk_dict(data, 0, {b"info": on_info})
+
+    if not span:
+        raise BencodeError("Missing info dictionary")
+    for key, field in (
+        ("name", "name"),
+        ("piece_length", "piece length"),
+        ("pieces_bytes", "pieces"),
+    ):
+        if key not in info:
+            raise BencodeError(f"Missing '{field}' in the info dictionary")
+
+    if "files" in info:
+        files = [(f"{info['name']}/{path}", size) for path, size in info["files"]]
+    elif "length" in info:
+        files = [(info["name"], info["length"])]
+    else:
+        raise BencodeError("Info dictionary has neither 'length' nor 'files'")
+
+    if any(size < 0 for _, size in files) or info["piece_length"] <= 0:
+        raise BencodeError("Negative file size or invalid piece length")
+    if info["pieces_bytes"] % 20 != 0:
+        raise BencodeError("Length of 'pieces' is not a multiple of 20")
+
+    piece_count = info["pieces_bytes"] // 20
+    total_size = sum(size for _, size in files)
+    if piece_count != -(-total_size // info["piece_length"]):
+        raise BencodeError(
+            f"{piece_count} pieces do not match a total size of {total_size}"
+        )
+
+    return TorrentSummary(
+        infohash=hashlib.sha1(memoryview(data)[span[0] : span[1]]).hexdigest(),
+        name=info["name"],
+        piece_length=info["piece_length"],
+        piece_count=piece_count,
+        files=files,
+    )
@@ -1,3 +1,21 @@
 from .database import conn, initialize, close
+from .schema import create_schema
+from .writer import StatsRow, insert_torrent_stats, max_variable_number
+from .recorder import StatsRecorder, RecordSummary
+from .executor import DatabaseExecutor
+from .usage import total_used_bytes, reconcile_torrent_usage
 
-__all__ = ["conn", "initialize", "close"]
+__all__ = [
+    "conn",
+    "initialize",
+    "close",
+    "create_schema",
+    "StatsRow",
+    "insert_torrent_stats",
+    "max_variable_number",
+    "StatsRecorder",
+    "RecordSummary",
+    "DatabaseExecutor",
+    "total_used_bytes",
+    "reconcile_torrent_usage",
+]
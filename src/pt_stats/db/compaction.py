@@ -0,0 +1,341 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple, Sequence
+from pt_stats.db.models import (
+    StatsRollup,
+    TorrentStats,
+    TorrentStatsHourly,
+    TorrentStatsDaily,
+    TransferRollup,
+)
+
+# Columns summarized in the rollup tiers
+METRICS = (
+    "connected_seeders",
+    "swarm_seeders",
+    "connected_leechers",
+    "swarm_leechers",
+    "uploaded_bytes",
+    "downloaded_bytes",
+)
+
+AGGREGATES = ("first", "last", "min", "max")
+
+
+class CompactionSummary(NamedTuple):
+    raw_compacted: int  # raw samples rolled up into the hourly tier
+    hourly_compacted: int  # hourly buckets rolled up into the daily tier
+    daily_expired: int  # daily buckets dropped
+    transfer_expired: int  # transfer rollups dropped
+
+
+def _rollup_columns() -> list[str]:
+    return [f"{m}_{a}" for m in METRICS for a in AGGREGATES]
+
+
+def _upsert_clause() -> str:
+    """
+    Merge a bucket into an existing one. Only happens to the buckets of
+    the latest sample of a torrent, which is held back until a newer
+    sample exists.
+    """
+    sets = [
+        "first_time = MIN(first_time, excluded.first_time)",
+        "last_time = MAX(last_time, excluded.last_time)",
+        "sample_count = sample_count + excluded.sample_count",
+    ]
+    for m in METRICS:
+        sets += [
+            f"{m}_first = CASE WHEN excluded.first_time < first_time "
+            f"THEN excluded.{m}_first ELSE {m}_first END",
+            f"{m}_last = CASE WHEN excluded.last_time > last_time "
+            f"THEN excluded.{m}_last ELSE {m}_last END",
+            f"{m}_min = MIN({m}_min, excluded.{m}_min)",
+            f"{m}_max = MAX({m}_max, excluded.{m}_max)",
+        ]
+    return "ON CONFLICT (torrent_id, bucket_time) DO UPDATE SET " + ", ".join(sets)
+
+
+def _insert_head(tier: type[StatsRollup]) -> str:
+    columns = [
+        "torrent_id",
+        "bucket_time",
+        "first_time",
+        "last_time",
+        "sample_count",
+        *_rollup_columns(),
+    ]
+    return f"INSERT INTO {tier._meta.table_name} ({', '.join(columns)})"  # type: ignore
+
+
+def _rollup_raw_sql(tier: type[StatsRollup]) -> str:
+    """
+    Roll raw samples older than the cutoff (first parameter) into `tier`.
+    The latest sample of every torrent is kept as is.
+    """
+    aggregates = []
+    for m in METRICS:
+        aggregates += [
+            f"MAX(CASE WHEN rn_asc = 1 THEN {m} END)",
+            f"MAX(CASE WHEN rn_desc = 1 THEN {m} END)",
+            f"MIN({m})",
+            f"MAX({m})",
+        ]
+
+    return f"""
+{_insert_head(tier)}
+SELECT
+    torrent_id,
+    bucket_time,
+    MIN(recorded_time),
+    MAX(recorded_time),
+    COUNT(*),
+    {', '.join(aggregates)}
+FROM (
+    SELECT
+        ts.*,
+        (ts.recorded_time / {tier.period}) * {tier.period} AS bucket_time,
+        ROW_NUMBER() OVER (
+            PARTITION BY ts.torrent_id, ts.recorded_time / {tier.period}
+            ORDER BY ts.recorded_time ASC
+        ) AS rn_asc,
+        ROW_NUMBER() OVER (
+            PARTITION BY ts.torrent_id, ts.recorded_time / {tier.period}
+            ORDER BY ts.recorded_time DESC
+        ) AS rn_desc
+    FROM torrentstats ts
+    WHERE ts.recorded_time < ?
+      AND ts.id NOT IN (SELECT stat_id FROM torrent_latest_stats)
+)
+GROUP BY torrent_id, bucket_time
+{_upsert_clause()}
+"""
+
+
+def _rollup_tier_sql(src: type[StatsRollup], dst: type[StatsRollup]) -> str:
+    """
+    Roll the buckets of `src` older than the cutoff (first parameter)
+    into the coarser buckets of `dst`.
+    """
+    aggregates = []
+    for m in METRICS:
+        aggregates += [
+            f"MAX(CASE WHEN rn_asc = 1 THEN {m}_first END)",
+            f"MAX(CASE WHEN rn_desc = 1 THEN {m}_last END)",
+            f"MIN({m}_min)",
+            f"MAX({m}_max)",
+        ]
+
+    return f"""
+{_insert_head(dst)}
+SELECT
+    torrent_id,
+    dst_bucket_time,
+    MIN(first_time),
+    MAX(last_time),
+    SUM(sample_count),
+    {', '.join(aggregates)}
+FROM (
+    SELECT
+        src.*,
+        (src.bucket_time / {dst.period}) * {dst.period} AS dst_bucket_time,
+        ROW_NUMBER() OVER (
+            PARTITION BY src.torrent_id, src.bucket_time / {dst.period}
+            ORDER BY src.first_time ASC
+        ) AS rn_asc,
+        ROW_NUMBER() OVER (
+            PARTITION BY src.torrent_id, src.bucket_time / {dst.period}
+            ORDER BY src.last_time DESC
+        ) AS rn_desc
+    FROM {src._meta.table_name} src
+    WHERE src.bucket_time < ?
+)
+GROUP BY torrent_id, dst_bucket_time
+{_upsert_clause()}
+"""
+
+
+def _align(ts: int, period: int) -> int:
+    return ts - ts % period
+
+
+def compact_torrent_stats(
+    now: datetime,
+    *,
+    raw_retention: timedelta | None,
+    hourly_retention: timedelta | None,
+    daily_retention: timedelta | None,
+) -> CompactionSummary:
+    """
+    Downsample old `TorrentStats` rows into the hourly and daily tiers.
+
+    - Raw samples older than `raw_retention` are rolled up into hourly
+      buckets and deleted. The latest sample of every torrent is kept.
+    - Hourly buckets older than `hourly_retention` are rolled up into
+      daily buckets and deleted.
+    - Daily buckets older than `daily_retention` are deleted.
+    - Transfer rollups follow the tier of the same period: hourly ones
+      older than `hourly_retention` and daily ones older than
+      `daily_retention` are deleted. Reports compute the hours before the
+      oldest hourly rollup from the samples instead.
+
+    A retention of None disables the corresponding step. Cutoffs are
+    aligned down to the bucket length of the destination tier, so a
+    bucket is always rolled up in one go.
+    """
+    conn = TorrentStats._meta.database  # type: ignore
+    to_ts = TorrentStats.recorded_time.db_value
+    now_ts = to_ts(now)
+
+    raw_compacted = hourly_compacted = daily_expired = transfer_expired = 0
+    with conn.atomic():
+        if raw_retention is not None:
+            cutoff = _align(
+                now_ts - int(raw_retention.total_seconds()), TorrentStatsHourly.period
+            )
+            conn.execute_sql(_rollup_raw_sql(TorrentStatsHourly), (cutoff,))
+            raw_compacted = conn.execute_sql(
+                "DELETE FROM torrentstats WHERE recorded_time < ? "
+                "AND id NOT IN (SELECT stat_id FROM torrent_latest_stats)",
+                (cutoff,),
+            ).rowcount
+
+        if hourly_retention is not None:
+            cutoff = _align(
+                now_ts - int(hourly_retention.total_seconds()), TorrentStatsDaily.period
+            )
+            conn.execute_sql(
+                _rollup_tier_sql(TorrentStatsHourly, TorrentStatsDaily), (cutoff,)
+            )
+            hourly_compacted = (
+                TorrentStatsHourly.delete()
+                .where(TorrentStatsHourly.bucket_time < cutoff)
+                .execute()
+            )
+            transfer_expired += (
+                TransferRollup.delete()
+                .where(
+                    (TransferRollup.period == TorrentStatsHourly.period)
+                    & (TransferRollup.bucket_time < cutoff)
+                )
+                .execute()
+            )
+
+        if daily_retention is not None:
+            cutoff = now_ts - int(daily_retention.total_seconds())
+            daily_expired = (
+                TorrentStatsDaily.delete()
+                .where(TorrentStatsDaily.bucket_time < cutoff)
+                .execute()
+            )
+            transfer_expired += (
+                TransferRollup.delete()
+                .where(
+                    (TransferRollup.period == TorrentStatsDaily.period)
+                    & (TransferRollup.bucket_time < cutoff)
+                )
+                .execute()
+            )
+
+    # Give the space of the moved rows back to the WAL file. SQLite reuses
+    # the freed pages of the main file for new rows.
+    conn.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    return CompactionSummary(
+        raw_compacted=raw_compacted,
+        hourly_compacted=hourly_compacted,
+        daily_expired=daily_expired,
+        transfer_expired=transfer_expired,
+    )
+
+
+def tiered_samples_sql(
+    start: datetime,
+    end: datetime,
+    metrics: Sequence[str] = ("uploaded_bytes", "downloaded_bytes"),
+) -> tuple[str, list]:
+    """
+    SQL (and its parameters) selecting the samples within [start, end]
+    from whichever tier holds them, as `(torrent_id, recorded_time,
+    *metrics)` rows (by default the uploaded and downloaded bytes).
+
+    Raw samples are returned as is. Each rollup bucket contributes its
+    first and last sample (once if they are the same sample). Tiers never
+    hold the same sample, so the union is the list of all known samples
+    in the range. Meant to be used as
+    the body of a CTE.
+    """
+    to_ts = TorrentStats.recorded_time.db_value
+    start_ts, end_ts = to_ts(start), to_ts(end)
+
+    parts = [f"""
+    SELECT torrent_id, recorded_time, {', '.join(metrics)}
+    FROM torrentstats
+    WHERE recorded_time >= ? AND recorded_time <= ?"""]
+    params: list = [start_ts, end_ts]
+
+    for tier in (TorrentStatsHourly, TorrentStatsDaily):
+        for point in ("first", "last"):
+            columns = ", ".join(f"{m}_{point}" for m in metrics)
+            parts.append(
+                f"""
+    SELECT torrent_id, {point}_time, {columns}
+    FROM {tier._meta.table_name}
+    WHERE bucket_time > ? AND bucket_time <= ?
+      AND {point}_time >= ? AND {point}_time <= ?"""  # type: ignore
+                + ("\n      AND last_time > first_time" if point == "last" else "")
+            )
+            params += [start_ts - tier.period, end_ts, start_ts, end_ts]
+
+    return "\n    UNION ALL".join(parts), params
+
+
+def previous_samples_sql(
+    before: datetime,
+    metrics: Sequence[str] = ("uploaded_bytes", "downloaded_bytes"),
+) -> tuple[str, list]:
+    """
+    SQL (and its parameters) selecting `(torrent_id, recorded_time,
+    *metrics)` samples before `before`, among which the latest sample of
+    every torrent before `before`, however old. Each part is one index
+    seek per torrent (CROSS JOIN keeps SQLite from scanning the samples
+    instead).
+
+    In a rollup tier, that sample is a point of the latest bucket starting
+    before `before`, or, if both points of that bucket are later, the last
+    point of the bucket before it.
+    """
+    before_ts = TorrentStats.recorded_time.db_value(before)
+    columns = ", ".join(f"s.{m}" for m in metrics)
+    parts = [f"""
+    SELECT s.torrent_id, s.recorded_time, {columns}
+    FROM torrents t
+    CROSS JOIN torrentstats s
+    WHERE s.torrent_id = t.id
+      AND s.recorded_time = (
+        SELECT MAX(recorded_time) FROM torrentstats
+        WHERE torrent_id = t.id AND recorded_time < ?
+      )"""]
+    params: list = [before_ts]
+
+    for tier in (TorrentStatsHourly, TorrentStatsDaily):
+        table = tier._meta.table_name  # type: ignore
+        points = [
+            (before_ts - 1, "first"),
+            (before_ts - 1, "last"),
+            (before_ts - tier.period, "last"),
+        ]
+        for latest_bucket, point in points:
+            columns = ", ".join(f"r.{m}_{point}" for m in metrics)
+            parts.append(f"""
+    SELECT r.torrent_id, r.{point}_time, {columns}
+    FROM torrents t
+    CROSS JOIN {table} r
+    WHERE r.torrent_id = t.id
+      AND r.bucket_time = (
+        SELECT MAX(bucket_time) FROM {table}
+        WHERE torrent_id = t.id AND bucket_time <= ?
+      )
+      AND r.{point}_time < ?""")
+            params += [latest_bucket, before_ts]
+
+    return "\n    UNION ALL".join(parts), params
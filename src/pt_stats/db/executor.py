@@ -0,0 +1,78 @@
+import asyncio as aio
+import functools
+import attrs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+from pt_stats.db.database import conn
+
+T = TypeVar("T")
+
+
+@attrs.define
+class DatabaseExecutor:
+    """
+    Run peewee calls off the event loop.
+
+    Writes run on one dedicated writer thread, so they never wait for
+    SQLite's write lock behind each other. A write that runs several
+    statements should open its own transaction (`conn.atomic()`).
+
+    Reads run on a small pool of reader threads. `SqliteDatabase` opens one
+    connection per thread, so every reader has its own WAL connection and
+    reads a consistent snapshot while the writer (or a checkpoint) works.
+
+    An in-memory database only exists on the connection that created it,
+    so with ':memory:' everything runs inline on the calling thread.
+
+    Usage:
+        dbx = DatabaseExecutor(readers=2)
+        rows = await dbx.read(lambda: list(Torrents.select()))
+        await dbx.write(Torrents.create, **fields)
+    """
+
+    readers: int = 2
+
+    _writer: ThreadPoolExecutor = attrs.field(init=False)
+    _reader_pool: ThreadPoolExecutor = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=max(1, self.readers), thread_name_prefix="db-reader"
+        )
+
+    @property
+    def inline(self) -> bool:
+        return conn.obj is None or conn.obj.database == ":memory:"
+
+    async def read(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run `fn(*args, **kwargs)` on a reader thread.
+        """
+        if self.inline:
+            return fn(*args, **kwargs)
+
+        loop = aio.get_running_loop()
+        return await loop.run_in_executor(
+            self._reader_pool, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def write(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run `fn(*args, **kwargs)` on the writer thread.
+        """
+        if self.inline:
+            return fn(*args, **kwargs)
+
+        loop = aio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(fn, *args, **kwargs)
+        )
+
+    def shutdown(self):
+        """
+        Wait for the pending calls and stop the threads. The connection of
+        each thread is closed when the thread exits.
+        """
+        self._writer.shutdown(wait=True)
+        self._reader_pool.shutdown(wait=True)
@@ -0,0 +1,150 @@
+"""
+Export of the `TorrentStats` history to Parquet, partitioned by day, for
+offline analysis in columnar engines (DuckDB, Polars, pandas, ...).
+
+Needs the optional `pyarrow` dependency (`pip install pt-stats[export]`).
+"""
+
+import json
+import os
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+from pt_stats.db.models import TorrentStats
+
+STATE_FILE = "_export_state.json"
+
+SELECT_STATS_AFTER = r"""
+SELECT
+    ts.id, ts.torrent_id, t.torrent_hash, t.name, t.size_bytes,
+    ts.recorded_time,
+    ts.connected_seeders, ts.swarm_seeders, ts.connected_leechers, ts.swarm_leechers,
+    ts.uploaded_bytes, ts.downloaded_bytes
+FROM torrentstats ts
+JOIN torrents t ON t.id = ts.torrent_id
+WHERE ts.id > ?
+ORDER BY ts.id
+LIMIT ?
+"""
+
+
+class ExportSummary(NamedTuple):
+    rows: int  # rows written by this run
+    files: int  # Parquet files written by this run
+    last_id: int  # highest exported `TorrentStats.id` so far
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("torrent_id", pa.int64()),
+            ("torrent_hash", pa.string()),
+            ("name", pa.string()),
+            ("size_bytes", pa.int64()),
+            ("recorded_time", pa.timestamp("s", tz="UTC")),
+            ("connected_seeders", pa.int32()),
+            ("swarm_seeders", pa.int32()),
+            ("connected_leechers", pa.int32()),
+            ("swarm_leechers", pa.int32()),
+            ("uploaded_bytes", pa.int64()),
+            ("downloaded_bytes", pa.int64()),
+        ]
+    )
+
+
+def read_export_state(out_dir: Path) -> int:
+    """The highest `TorrentStats.id` exported to `out_dir`, 0 if none."""
+    path = out_dir / STATE_FILE
+    if not path.exists():
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return int(json.load(f)["last_id"])
+
+
+def _write_export_state(out_dir: Path, last_id: int):
+    tmp = out_dir / (STATE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_id": last_id}, f)
+    os.replace(tmp, out_dir / STATE_FILE)
+
+
+def export_torrent_stats(
+    out_dir: Path, *, batch_size: int = 100_000, full: bool = False
+) -> ExportSummary:
+    """
+    Export the `TorrentStats` rows (joined with the torrent hash, name and
+    size) added since the last export to `out_dir`, as Parquet files
+    partitioned by the UTC day of `recorded_time`:
+
+        out_dir/day=2025-01-31/part-<first id>-<last id>.parquet
+
+    Rows are read by keyset pagination on the id, `batch_size` rows per
+    short read transaction, so memory stays bounded and the database is
+    never held open for the whole export. Each batch is written to
+    temporary files that are renamed once complete, then the highest
+    exported id is saved to `out_dir/_export_state.json`. An interrupted
+    export resumes after the last complete batch.
+
+    With `full`, the previous export (files and state) is removed first.
+
+    Rows are exported once: the tail rows whose `recorded_time` is moved
+    forward later (see `StatsRecorder`) keep the time they had when
+    exported, and rows deleted by the compaction stay in the export.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if full:
+        for path in out_dir.glob("day=*/*.parquet"):
+            path.unlink()
+        (out_dir / STATE_FILE).unlink(missing_ok=True)
+    # Leftovers of an interrupted batch
+    for path in out_dir.glob("day=*/.*.parquet.tmp"):
+        path.unlink()
+
+    schema = _arrow_schema()
+    conn = TorrentStats._meta.database  # type: ignore
+    last_id = read_export_state(out_dir)
+    rows = files = 0
+
+    while True:
+        batch = conn.execute_sql(SELECT_STATS_AFTER, (last_id, batch_size)).fetchall()
+        if not batch:
+            break
+
+        columns = list(zip(*batch))
+        table = pa.Table.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema,
+        )
+        days = np.asarray(columns[5], dtype=np.int64) // 86400
+
+        written: list[tuple[Path, Path]] = []
+        for day in np.unique(days):
+            part = table.take(np.flatnonzero(days == day))
+            ids = part.column("id")
+            name = f"part-{ids[0].as_py():012d}-{ids[-1].as_py():012d}.parquet"
+            day_str = datetime.fromtimestamp(int(day) * 86400, tz=timezone.utc)
+            day_dir = out_dir / f"day={day_str:%Y-%m-%d}"
+            day_dir.mkdir(exist_ok=True)
+
+            tmp = day_dir / f".{name}.tmp"
+            pq.write_table(part, tmp, compression="zstd")
+            written.append((tmp, day_dir / name))
+
+        for tmp, path in written:
+            os.replace(tmp, path)
+        last_id = batch[-1][0]
+        _write_export_state(out_dir, last_id)
+
+        rows += len(batch)
+        files += len(written)
+        if len(batch) < batch_size:
+            break
+
+    return ExportSummary(rows=rows, files=files, last_id=last_id)
@@ -1,9 +1,33 @@
-from .core import Sites, Torrents, TorrentStats, StatsComputed, TorrentsComputed
+from .core import (
+    Sites,
+    Torrents,
+    TorrentStats,
+    TorrentLatestStats,
+    TorrentUsage,
+    UsageTotals,
+    StatsRollup,
+    TorrentStatsHourly,
+    TorrentStatsDaily,
+    TransferRollup,
+    TorrentScore,
+    TorrentFileCache,
+    StatsComputed,
+    TorrentsComputed,
+)
 
 __all__ = [
     "Sites",
     "Torrents",
     "TorrentStats",
+    "TorrentLatestStats",
+    "TorrentUsage",
+    "UsageTotals",
+    "StatsRollup",
+    "TorrentStatsHourly",
+    "TorrentStatsDaily",
+    "TransferRollup",
+    "TorrentScore",
+    "TorrentFileCache",
     "StatsComputed",
     "TorrentsComputed",
 ]
@@ -63,6 +63,521 @@ class TorrentStats(DatabaseModel):
     class Meta:
         indexes = (
             (("torrent", "recorded_time"), True),  # (torrent, recorded_time), unique
+            # Time range scans (reports, compaction, scoring). Covers the
+            # counters, so the range is read from the index alone.
+            (("recorded_time", "torrent", "uploaded_bytes", "downloaded_bytes"), False),
+        )
+
+
+class TorrentLatestStats(DatabaseModel):
+    """
+    The latest `TorrentStats` row of every torrent.
+
+    This table is maintained by triggers on `torrentstats`, so it is
+    updated in the same transaction as every insert into (or update of)
+    the stats table, whatever code path writes it.
+    """
+
+    torrent = peewee.ForeignKeyField(Torrents, primary_key=True, backref="latest_stats")
+    stat_id = peewee.IntegerField(unique=True)
+
+    recorded_time = peewee.TimestampField(resolution=1, utc=True)
+    connected_seeders = peewee.IntegerField()
+    swarm_seeders = peewee.IntegerField()
+    connected_leechers = peewee.IntegerField()
+    swarm_leechers = peewee.IntegerField()
+
+    uploaded_bytes = peewee.BigIntegerField()
+    downloaded_bytes = peewee.BigIntegerField()
+
+    class Meta:
+        table_name = "torrent_latest_stats"
+
+    @staticmethod
+    def create_triggers():
+        """
+        Create the maintenance triggers, and fill the table from the
+        existing stats if it is empty (e.g., on an older database).
+        """
+        conn = TorrentLatestStats._meta.database  # type: ignore
+        with conn.atomic():
+            for sql in CREATE_TRIGGERS_LATEST_STATS:
+                conn.execute_sql(sql)
+
+            if not TorrentLatestStats.select().exists():
+                conn.execute_sql(BACKFILL_LATEST_STATS)
+
+
+_LATEST_STATS_UPSERT = r"""
+    INSERT INTO torrent_latest_stats (
+        torrent_id, stat_id, recorded_time,
+        connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+        uploaded_bytes, downloaded_bytes
+    )
+    VALUES (
+        NEW.torrent_id, NEW.id, NEW.recorded_time,
+        NEW.connected_seeders, NEW.swarm_seeders, NEW.connected_leechers, NEW.swarm_leechers,
+        NEW.uploaded_bytes, NEW.downloaded_bytes
+    )
+    ON CONFLICT (torrent_id) DO UPDATE SET
+        stat_id = excluded.stat_id,
+        recorded_time = excluded.recorded_time,
+        connected_seeders = excluded.connected_seeders,
+        swarm_seeders = excluded.swarm_seeders,
+        connected_leechers = excluded.connected_leechers,
+        swarm_leechers = excluded.swarm_leechers,
+        uploaded_bytes = excluded.uploaded_bytes,
+        downloaded_bytes = excluded.downloaded_bytes
+    -- Only move forward, or refresh the row that is already the latest
+    WHERE excluded.recorded_time >= torrent_latest_stats.recorded_time
+       OR excluded.stat_id = torrent_latest_stats.stat_id;
+"""
+
+CREATE_TRIGGERS_LATEST_STATS = [
+    rf"""
+CREATE TRIGGER IF NOT EXISTS trg_latest_stats_insert
+AFTER INSERT ON torrentstats
+BEGIN
+{_LATEST_STATS_UPSERT}
+END
+""",
+    rf"""
+CREATE TRIGGER IF NOT EXISTS trg_latest_stats_update
+AFTER UPDATE ON torrentstats
+BEGIN
+{_LATEST_STATS_UPSERT}
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_latest_stats_delete
+AFTER DELETE ON torrentstats
+WHEN EXISTS (SELECT 1 FROM torrent_latest_stats WHERE stat_id = OLD.id)
+BEGIN
+    DELETE FROM torrent_latest_stats WHERE stat_id = OLD.id;
+
+    -- Fall back to the newest remaining row, if any
+    INSERT INTO torrent_latest_stats (
+        torrent_id, stat_id, recorded_time,
+        connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+        uploaded_bytes, downloaded_bytes
+    )
+    SELECT
+        ts.torrent_id, ts.id, ts.recorded_time,
+        ts.connected_seeders, ts.swarm_seeders, ts.connected_leechers, ts.swarm_leechers,
+        ts.uploaded_bytes, ts.downloaded_bytes
+    FROM torrentstats ts
+    WHERE ts.torrent_id = OLD.torrent_id
+    ORDER BY ts.recorded_time DESC
+    LIMIT 1;
+END
+""",
+]
+
+BACKFILL_LATEST_STATS = r"""
+INSERT INTO torrent_latest_stats (
+    torrent_id, stat_id, recorded_time,
+    connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+    uploaded_bytes, downloaded_bytes
+)
+SELECT
+    torrent_id, id, recorded_time,
+    connected_seeders, swarm_seeders, connected_leechers, swarm_leechers,
+    uploaded_bytes, downloaded_bytes
+FROM (
+    SELECT
+        ts.*,
+        ROW_NUMBER()
+        OVER (
+            PARTITION BY ts.torrent_id
+            ORDER BY ts.recorded_time DESC
+        ) AS rn
+    FROM torrentstats ts
+)
+WHERE rn = 1
+"""
+
+
+class TorrentUsage(DatabaseModel):
+    """
+    The disk space counted for every torrent that is not deleted.
+
+    Rows are created and removed by triggers on `torrents`, in the same
+    transaction that adds or (soft-)deletes a torrent, starting at the
+    declared `size_bytes`. `used_bytes` may then be reconciled with what
+    qBittorrent reports (see `pt_stats.db.reconcile_torrent_usage`).
+    """
+
+    torrent = peewee.ForeignKeyField(Torrents, primary_key=True, backref="usage")
+    used_bytes = peewee.BigIntegerField()
+
+    class Meta:
+        table_name = "torrent_usage"
+
+    @staticmethod
+    def create_triggers():
+        """
+        Create the maintenance triggers of `torrent_usage` and
+        `usage_totals`, and fill both tables if they are empty (e.g., on
+        an older database).
+        """
+        conn = TorrentUsage._meta.database  # type: ignore
+        with conn.atomic():
+            for sql in CREATE_TRIGGERS_USAGE:
+                conn.execute_sql(sql)
+
+            if not UsageTotals.select().exists():
+                conn.execute_sql(BACKFILL_TORRENT_USAGE)
+                conn.execute_sql(BACKFILL_USAGE_TOTALS)
+
+
+class UsageTotals(DatabaseModel):
+    """
+    Sum of `torrent_usage`, a single row (id = 1) maintained by triggers.
+    """
+
+    id = peewee.IntegerField(primary_key=True)
+    used_bytes = peewee.BigIntegerField(default=0)
+    torrent_count = peewee.IntegerField(default=0)
+
+    class Meta:
+        table_name = "usage_totals"
+
+
+CREATE_TRIGGERS_USAGE = [
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_torrent_insert
+AFTER INSERT ON torrents
+WHEN NEW.delete_time IS NULL
+BEGIN
+    INSERT INTO torrent_usage (torrent_id, used_bytes)
+    VALUES (NEW.id, NEW.size_bytes);
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_torrent_soft_delete
+AFTER UPDATE OF delete_time ON torrents
+WHEN OLD.delete_time IS NULL AND NEW.delete_time IS NOT NULL
+BEGIN
+    DELETE FROM torrent_usage WHERE torrent_id = OLD.id;
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_torrent_undelete
+AFTER UPDATE OF delete_time ON torrents
+WHEN OLD.delete_time IS NOT NULL AND NEW.delete_time IS NULL
+BEGIN
+    INSERT OR IGNORE INTO torrent_usage (torrent_id, used_bytes)
+    VALUES (NEW.id, NEW.size_bytes);
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_torrent_delete
+AFTER DELETE ON torrents
+BEGIN
+    DELETE FROM torrent_usage WHERE torrent_id = OLD.id;
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_totals_insert
+AFTER INSERT ON torrent_usage
+BEGIN
+    UPDATE usage_totals
+    SET used_bytes = used_bytes + NEW.used_bytes,
+        torrent_count = torrent_count + 1
+    WHERE id = 1;
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_totals_update
+AFTER UPDATE OF used_bytes ON torrent_usage
+WHEN NEW.used_bytes != OLD.used_bytes
+BEGIN
+    UPDATE usage_totals
+    SET used_bytes = used_bytes + NEW.used_bytes - OLD.used_bytes
+    WHERE id = 1;
+END
+""",
+    r"""
+CREATE TRIGGER IF NOT EXISTS trg_usage_totals_delete
+AFTER DELETE ON torrent_usage
+BEGIN
+    UPDATE usage_totals
+    SET used_bytes = used_bytes - OLD.used_bytes,
+        torrent_count = torrent_count - 1
+    WHERE id = 1;
+END
+""",
+]
+
+BACKFILL_TORRENT_USAGE = r"""
+INSERT OR REPLACE INTO torrent_usage (torrent_id, used_bytes)
+SELECT id, size_bytes FROM torrents WHERE delete_time IS NULL
+"""
+
+# Runs after BACKFILL_TORRENT_USAGE, while usage_totals has no row yet (so
+# the triggers above had nothing to update).
+BACKFILL_USAGE_TOTALS = r"""
+INSERT INTO usage_totals (id, used_bytes, torrent_count)
+SELECT 1, COALESCE(SUM(used_bytes), 0), COUNT(*) FROM torrent_usage
+"""
+
+
+class StatsRollup(DatabaseModel):
+    """
+    Base model of the downsampled tiers of `TorrentStats`.
+
+    Each row summarizes the samples of one torrent in one bucket of
+    `period` seconds: the first and last sample (by `recorded_time`), and
+    the minimum and maximum of every counter.
+    """
+
+    torrent = peewee.ForeignKeyField(Torrents)
+    bucket_time = peewee.TimestampField(resolution=1, utc=True)  # bucket start
+
+    first_time = peewee.TimestampField(resolution=1, utc=True)
+    last_time = peewee.TimestampField(resolution=1, utc=True)
+    sample_count = peewee.IntegerField()
+
+    connected_seeders_first = peewee.IntegerField()
+    connected_seeders_last = peewee.IntegerField()
+    connected_seeders_min = peewee.IntegerField()
+    connected_seeders_max = peewee.IntegerField()
+
+    swarm_seeders_first = peewee.IntegerField()
+    swarm_seeders_last = peewee.IntegerField()
+    swarm_seeders_min = peewee.IntegerField()
+    swarm_seeders_max = peewee.IntegerField()
+
+    connected_leechers_first = peewee.IntegerField()
+    connected_leechers_last = peewee.IntegerField()
+    connected_leechers_min = peewee.IntegerField()
+    connected_leechers_max = peewee.IntegerField()
+
+    swarm_leechers_first = peewee.IntegerField()
+    swarm_leechers_last = peewee.IntegerField()
+    swarm_leechers_min = peewee.IntegerField()
+    swarm_leechers_max = peewee.IntegerField()
+
+    uploaded_bytes_first = peewee.BigIntegerField()
+    uploaded_bytes_last = peewee.BigIntegerField()
+    uploaded_bytes_min = peewee.BigIntegerField()
+    uploaded_bytes_max = peewee.BigIntegerField()
+
+    downloaded_bytes_first = peewee.BigIntegerField()
+    downloaded_bytes_last = peewee.BigIntegerField()
+    downloaded_bytes_min = peewee.BigIntegerField()
+    downloaded_bytes_max = peewee.BigIntegerField()
+
+    period: int = 0  # bucket length in seconds
+
+    class Meta:
+        indexes = (
+            (("torrent", "bucket_time"), True),  # (torrent, bucket_time), unique
+            (("bucket_time",), False),  # range scans on compaction and reports
+        )
+
+
+class TorrentStatsHourly(StatsRollup):
+    period = 3600
+
+    class Meta:
+        table_name = "torrentstats_hourly"
+
+
+class TorrentStatsDaily(StatsRollup):
+    period = 86400
+
+    class Meta:
+        table_name = "torrentstats_daily"
+
+
+class TransferRollup(DatabaseModel):
+    """
+    Uploaded and downloaded bytes of every torrent per hour and per day
+    (`period` of 3600 or 86400 seconds), maintained by a trigger on
+    `torrentstats` so that transfer reports over long ranges do not read
+    the samples.
+
+    Every new sample adds the step from the previous sample of its torrent
+    to the bucket holding the new sample. A counter that dropped (e.g.,
+    the torrent was re-added) counts from 0 again. Only steps that moved
+    a counter create rows. Samples are assumed to be inserted in time
+    order per torrent, which is what the sampler does.
+    """
+
+    torrent = peewee.ForeignKeyField(Torrents)
+    period = peewee.IntegerField()  # bucket length in seconds
+    bucket_time = peewee.TimestampField(resolution=1, utc=True)  # bucket start
+
+    uploaded_bytes = peewee.BigIntegerField()
+    downloaded_bytes = peewee.BigIntegerField()
+
+    PERIODS = (3600, 86400)
+
+    class Meta:
+        table_name = "transfer_rollups"
+        indexes = (
+            (("torrent", "period", "bucket_time"), True),  # unique
+            # Range scans of the reports, covering the deltas
+            (
+                (
+                    "period",
+                    "bucket_time",
+                    "torrent",
+                    "uploaded_bytes",
+                    "downloaded_bytes",
+                ),
+                False,
+            ),
+        )
+
+    @staticmethod
+    def create_triggers():
+        """
+        Create the maintenance trigger, and fill the table from the
+        existing stats when the trigger did not exist yet (e.g., on an
+        older database).
+        """
+        conn = TransferRollup._meta.database  # type: ignore
+        with conn.atomic():
+            exists = conn.execute_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                ("trg_transfer_rollups_insert",),
+            ).fetchone()
+            conn.execute_sql(CREATE_TRIGGER_TRANSFER_ROLLUPS)
+
+            if exists is None:
+                conn.execute_sql("DELETE FROM transfer_rollups")
+                conn.execute_sql(BACKFILL_TRANSFER_ROLLUPS)
+
+
+_TRANSFER_PERIODS = " UNION ALL ".join(
+    f"SELECT {p} AS period" for p in TransferRollup.PERIODS
+)
+
+CREATE_TRIGGER_TRANSFER_ROLLUPS = rf"""
+CREATE TRIGGER IF NOT EXISTS trg_transfer_rollups_insert
+AFTER INSERT ON torrentstats
+BEGIN
+    INSERT INTO transfer_rollups (
+        torrent_id, period, bucket_time, uploaded_bytes, downloaded_bytes
+    )
+    SELECT
+        NEW.torrent_id, p.period, (NEW.recorded_time / p.period) * p.period,
+        step.uploaded, step.downloaded
+    FROM (
+        SELECT
+            CASE WHEN NEW.uploaded_bytes < prev.uploaded_bytes
+                THEN NEW.uploaded_bytes
+                ELSE NEW.uploaded_bytes - prev.uploaded_bytes
+            END AS uploaded,
+            CASE WHEN NEW.downloaded_bytes < prev.downloaded_bytes
+                THEN NEW.downloaded_bytes
+                ELSE NEW.downloaded_bytes - prev.downloaded_bytes
+            END AS downloaded
+        FROM torrentstats prev
+        WHERE prev.torrent_id = NEW.torrent_id
+          AND prev.recorded_time < NEW.recorded_time
+        ORDER BY prev.recorded_time DESC
+        LIMIT 1
+    ) step
+    CROSS JOIN ({_TRANSFER_PERIODS}) p
+    WHERE step.uploaded != 0 OR step.downloaded != 0
+    ON CONFLICT (torrent_id, period, bucket_time) DO UPDATE SET
+        uploaded_bytes = uploaded_bytes + excluded.uploaded_bytes,
+        downloaded_bytes = downloaded_bytes + excluded.downloaded_bytes;
+END
+"""
+
+# The same steps, over the samples of every tier (the first and last
+# sample of each rollup bucket).
+BACKFILL_TRANSFER_ROLLUPS = rf"""
+WITH samples AS (
+    SELECT torrent_id, recorded_time, uploaded_bytes, downloaded_bytes
+    FROM torrentstats
+    UNION ALL
+    SELECT torrent_id, first_time, uploaded_bytes_first, downloaded_bytes_first
+    FROM torrentstats_hourly
+    UNION ALL
+    SELECT torrent_id, last_time, uploaded_bytes_last, downloaded_bytes_last
+    FROM torrentstats_hourly WHERE last_time > first_time
+    UNION ALL
+    SELECT torrent_id, first_time, uploaded_bytes_first, downloaded_bytes_first
+    FROM torrentstats_daily
+    UNION ALL
+    SELECT torrent_id, last_time, uploaded_bytes_last, downloaded_bytes_last
+    FROM torrentstats_daily WHERE last_time > first_time
+),
+steps AS (
+    SELECT
+        torrent_id,
+        recorded_time,
+        uploaded_bytes,
+        uploaded_bytes - LAG(uploaded_bytes) OVER w AS uploaded_step,
+        downloaded_bytes,
+        downloaded_bytes - LAG(downloaded_bytes) OVER w AS downloaded_step
+    FROM samples
+    WINDOW w AS (PARTITION BY torrent_id ORDER BY recorded_time)
+)
+INSERT INTO transfer_rollups (
+    torrent_id, period, bucket_time, uploaded_bytes, downloaded_bytes
+)
+SELECT
+    torrent_id,
+    p.period,
+    (recorded_time / p.period) * p.period AS bucket,
+    SUM(CASE WHEN uploaded_step < 0 THEN uploaded_bytes ELSE uploaded_step END),
+    SUM(CASE WHEN downloaded_step < 0 THEN downloaded_bytes ELSE downloaded_step END)
+FROM steps
+CROSS JOIN ({_TRANSFER_PERIODS}) p
+WHERE uploaded_step != 0 OR downloaded_step != 0
+GROUP BY torrent_id, p.period, bucket
+"""
+
+
+class TorrentScore(DatabaseModel):
+    """
+    Recent popularity of every torrent that is not deleted, computed by
+    `pt_stats.db.scoring.compute_torrent_scores` and replaced as a whole
+    on every run by `replace_torrent_scores`.
+    """
+
+    torrent = peewee.ForeignKeyField(Torrents, primary_key=True, backref="score_row")
+    computed_time = peewee.TimestampField(resolution=1, utc=True)
+
+    upload_rate = peewee.FloatField()  # decayed upload rate, bytes per second
+    demand = peewee.FloatField()  # decayed swarm leechers per seeder
+    score = peewee.FloatField()
+
+    class Meta:
+        table_name = "torrent_scores"
+
+
+class TorrentFileCache(DatabaseModel):
+    """
+    Index of the .torrent files kept on disk by
+    `pt_stats.torrent_cache.TorrentCache`, keyed by (site, sitewise_id).
+    The files are stored under the SHA-1 of their content (`digest`).
+    """
+
+    site = peewee.ForeignKeyField(Sites)
+    sitewise_id = peewee.CharField()
+    digest = peewee.CharField()  # SHA-1 of the .torrent file
+    file_size = peewee.IntegerField()  # size of the .torrent file
+
+    infohash = peewee.CharField()
+    files = peewee.TextField()  # JSON list of [path, size] of the content
+    content_size = peewee.BigIntegerField()
+
+    last_access = peewee.TimestampField(
+        resolution=1, utc=True, default=lambda: datetime.now(timezone.utc)
+    )
+
+    class Meta:
+        table_name = "torrent_file_cache"
+        indexes = (
+            (("site", "sitewise_id"), True),  # (site, sitewise_id), unique
+            (("last_access",), False),  # eviction order
         )
 
 
@@ -163,6 +678,9 @@ class TorrentsComputed(DatabaseModel):
     @staticmethod
     def create_view():
         conn = TorrentsComputed._meta.database  # type: ignore
+        # The view used to scan the whole stats table, replace the old
+        # definition on existing databases.
+        conn.execute_sql("DROP VIEW IF EXISTS view_torrents_computed")
         conn.execute_sql(CREATE_VIEW_TORRENTS_COMPUTED)
 
     def __str__(self):
@@ -177,24 +695,13 @@ class TorrentsComputed(DatabaseModel):
 
 CREATE_VIEW_TORRENTS_COMPUTED = r"""
 CREATE VIEW IF NOT EXISTS view_torrents_computed AS
-WITH latest_stats AS (
-    SELECT 
-        ts.*,
-        ROW_NUMBER() 
-        OVER (
-            PARTITION BY ts.torrent_id 
-            ORDER BY ts.recorded_time DESC
-        ) AS rn
-    FROM torrentstats ts
-)
 SELECT
     t.id AS torrent_id,
-    ls.id AS latest_stat_id,
+    ls.stat_id AS latest_stat_id,
     ls.recorded_time,
     
     t.name as name,
     
-    -- Math Logic (Duplicated here for performance, to avoid calculating on discarded rows)
     -- ratio
     CASE 
         WHEN ls.downloaded_bytes > 0 
@@ -219,7 +726,7 @@ SELECT
         ELSE 0 
     END AS popularity
 FROM torrents t
-JOIN latest_stats ls ON t.id = ls.torrent_id
+-- torrent_latest_stats is keyed by torrent, one row per torrent
+JOIN torrent_latest_stats ls ON t.id = ls.torrent_id
 WHERE t.delete_time IS NULL
-  AND ls.rn = 1
 """
@@ -0,0 +1,207 @@
+"""
+The hot queries of the application, kept here so that their query plans
+can be checked against the indexes (see benchmarks/check_query_plans.py).
+"""
+
+import peewee
+from datetime import datetime, timezone
+from pt_stats.db.compaction import previous_samples_sql, tiered_samples_sql
+from pt_stats.db.models import (
+    Torrents,
+    TorrentStats,
+    TorrentsComputed,
+    TorrentUsage,
+    TorrentScore,
+    TransferRollup,
+)
+
+
+def alive_torrents_with_usage() -> peewee.ModelSelect:
+    """
+    Torrents that are not deleted, each with its counted `used_bytes`
+    (None if it has no usage row).
+    """
+    return (
+        Torrents.select(Torrents, TorrentUsage.used_bytes)
+        .join(TorrentUsage, peewee.JOIN.LEFT_OUTER)
+        .where(Torrents.delete_time.is_null())
+        .objects()
+    )
+
+
+def prune_candidates(with_scores: bool) -> peewee.ModelSelect:
+    """
+    Torrents that are not deleted and have statistics, with their lifetime
+    popularity and ratio (`.computed`), counted space (`.usage_row`) and,
+    if `with_scores`, their recent score (`.score_row`).
+    """
+    query = (
+        Torrents.select(
+            Torrents,
+            TorrentsComputed.popularity,
+            TorrentsComputed.ratio,
+            TorrentUsage.used_bytes,
+        )
+        .join(TorrentsComputed, attr="computed")
+        .switch(Torrents)
+        .join(TorrentUsage, attr="usage_row")
+    )
+    if with_scores:
+        query = (
+            query.select_extend(TorrentScore.score)
+            .switch(Torrents)
+            .join(TorrentScore, attr="score_row")
+        )
+    return query.where(Torrents.delete_time.is_null())
+
+
+def _step_sums_sql(start_ts: int, end_ts: int) -> tuple[str, list]:
+    """
+    SQL (and its parameters) selecting `(torrent_id, uploaded_delta,
+    downloaded_delta)`: the steps between consecutive samples whose later
+    sample is within [start_ts, end_ts], summed per torrent in one pass
+    (window over the samples, then one aggregation). The step into the
+    range starts from the latest sample before it, however old, as in the
+    `TransferRollup` trigger.
+
+    A counter that drops between two samples was reset (e.g., the torrent
+    was re-added), and the step counts the new value instead of going
+    negative.
+    """
+    to_dt = lambda ts: datetime.fromtimestamp(ts, tz=timezone.utc)  # noqa: E731
+    previous_sql, previous_params = previous_samples_sql(to_dt(start_ts))
+    samples_sql, samples_params = tiered_samples_sql(to_dt(start_ts), to_dt(end_ts))
+    sql = f"""
+    SELECT
+        torrent_id,
+        COALESCE(SUM(
+            CASE WHEN uploaded_step < 0 THEN uploaded_bytes ELSE uploaded_step END
+        ), 0) AS uploaded_delta,
+        COALESCE(SUM(
+            CASE WHEN downloaded_step < 0 THEN downloaded_bytes ELSE downloaded_step END
+        ), 0) AS downloaded_delta
+    FROM (
+        SELECT
+            torrent_id,
+            recorded_time,
+            uploaded_bytes,
+            uploaded_bytes - LAG(uploaded_bytes) OVER w AS uploaded_step,
+            downloaded_bytes,
+            downloaded_bytes - LAG(downloaded_bytes) OVER w AS downloaded_step
+        FROM ({samples_sql}
+            UNION ALL{previous_sql}
+        )
+        WINDOW w AS (PARTITION BY torrent_id ORDER BY recorded_time)
+    )
+    WHERE recorded_time >= ?
+    GROUP BY torrent_id"""
+    return sql, [*samples_params, *previous_params, start_ts]
+
+
+def transfer_deltas_sql(start: datetime, end: datetime) -> tuple[str, list]:
+    """
+    SQL (and its parameters) selecting `torrents.*` with the
+    `uploaded_delta` and `downloaded_delta` of every torrent with samples
+    within [start, end], computed from the samples.
+
+    The transfer of a step between two samples counts in the range of its
+    later sample, so adjacent ranges add up. The step into the range is
+    counted however long before `start` the sample before it is.
+    """
+    to_ts = TorrentStats.recorded_time.db_value
+    sums_sql, params = _step_sums_sql(to_ts(start), to_ts(end))
+    sql = f"""
+    SELECT t.*, deltas.uploaded_delta, deltas.downloaded_delta
+    FROM ({sums_sql}
+    ) deltas
+    JOIN torrents t ON t.id = deltas.torrent_id
+    """
+    return sql, params
+
+
+def rollup_transfer_deltas_sql(start: datetime, end: datetime) -> tuple[str, list]:
+    """
+    Same as `transfer_deltas_sql`, but the whole hours and days within
+    [start, end] are read from `TransferRollup`. Only the partial hours
+    at both ends of the range are computed from the samples.
+
+    The compaction deletes the hourly rollups older than the hourly
+    retention. The hours before the oldest hourly rollup left are
+    computed from the samples (the hourly/daily tiers) too.
+
+    Torrents without transfer in the whole buckets and without samples
+    at the ends of the range are not listed (their deltas would be 0).
+    """
+    hour, day = TransferRollup.PERIODS
+    to_ts = TorrentStats.recorded_time.db_value
+    start_ts, end_ts = to_ts(start), to_ts(end)
+
+    # Whole hours [hour_start, hour_end) and days [day_start, day_end)
+    hour_start = -(-start_ts // hour) * hour
+    hour_end = (end_ts + 1) // hour * hour
+    if hour_start >= hour_end:
+        return transfer_deltas_sql(start, end)
+    day_start = -(-hour_start // day) * day
+    day_end = hour_end // day * day
+    if day_start >= day_end:
+        day_start = day_end = hour_end
+
+    conn = TransferRollup._meta.database  # type: ignore
+    (hour_floor,) = conn.execute_sql(
+        f"SELECT MIN(bucket_time) FROM {TransferRollup._meta.table_name} "  # type: ignore
+        "WHERE period = ?",
+        (hour,),
+    ).fetchone()
+    if hour_floor is None:
+        hour_floor = hour_end
+
+    # Ranges [lo, hi] computed from the samples, and hours read from the
+    # rollups: the whole hours outside the whole days, from the floor on
+    sample_ranges = [(start_ts, hour_start - 1)]
+    hour_ranges = []
+    for lo, hi in ((hour_start, day_start), (day_end, hour_end)):
+        split = min(max(hour_floor, lo), hi)
+        sample_ranges.append((lo, split - 1))
+        hour_ranges.append((split, hi))
+    sample_ranges.append((hour_end, end_ts))
+
+    parts = [f"""
+    SELECT
+        torrent_id,
+        SUM(uploaded_bytes) AS uploaded_delta,
+        SUM(downloaded_bytes) AS downloaded_delta
+    FROM {TransferRollup._meta.table_name}
+    WHERE (period = ? AND bucket_time >= ? AND bucket_time < ?)
+       OR (period = ? AND bucket_time >= ? AND bucket_time < ?)
+       OR (period = ? AND bucket_time >= ? AND bucket_time < ?)
+    GROUP BY torrent_id"""]  # type: ignore
+    params: list = [
+        *(day, day_start, day_end),
+        *(hour, *hour_ranges[0]),
+        *(hour, *hour_ranges[1]),
+    ]
+    merged: list[tuple[int, int]] = []
+    for lo, hi in sample_ranges:
+        if lo > hi:
+            continue
+        if merged and merged[-1][1] + 1 == lo:
+            merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    for edge_start, edge_end in merged:
+        edge_sql, edge_params = _step_sums_sql(edge_start, edge_end)
+        parts.append(edge_sql)
+        params += edge_params
+
+    union = "\n    UNION ALL".join(parts)
+    sql = f"""
+    SELECT
+        t.*,
+        SUM(parts.uploaded_delta) AS uploaded_delta,
+        SUM(parts.downloaded_delta) AS downloaded_delta
+    FROM ({union}
+    ) parts
+    JOIN torrents t ON t.id = parts.torrent_id
+    GROUP BY t.id
+    """
+    return sql, params
@@ -0,0 +1,147 @@
+import attrs
+import peewee
+from collections import defaultdict
+from datetime import timedelta
+from typing import NamedTuple
+from pt_stats.db.models import TorrentStats, TorrentLatestStats
+from pt_stats.db.writer import StatsRow, insert_torrent_stats, max_variable_number
+
+
+class RecordSummary(NamedTuple):
+    inserted: int  # new rows written
+    extended: int  # tail rows moved forward to the sample time
+
+
+@attrs.define
+class _Run:
+    """
+    A run of identical samples of one torrent, stored as a head row (the
+    first sample with these values) and an optional tail row (the latest
+    sample with these values). Times are stored as database timestamps.
+    """
+
+    values: tuple
+    head_time: int
+    tail_time: int | None = None
+
+
+@attrs.define
+class StatsRecorder:
+    """
+    Write sampled `TorrentStats` rows, optionally only when they change.
+
+    With `record_on_change` disabled, every sample is inserted.
+
+    With `record_on_change` enabled, a torrent whose counters (uploaded
+    and downloaded bytes, connected and swarm peers) did not change since
+    its last stored sample does not get a new row. Instead, each run of
+    identical samples is stored as two rows:
+
+        - the head row, the first sample with these values;
+        - the tail row, whose `recorded_time` is moved forward to the
+          latest sample with these values.
+
+    Reading the table as "the value at time t is the last row at or
+    before t" then gives the same answer as the full history at every
+    sampling tick, so deltas over a time range and the "latest stats" of
+    a torrent are unchanged. A new head row is written at least every
+    `heartbeat` even if nothing changed, so every range longer than the
+    heartbeat contains a row for each sampled torrent.
+    """
+
+    record_on_change: bool = False
+    heartbeat: timedelta = timedelta(hours=1)
+
+    _runs: dict[int, _Run] = attrs.field(factory=dict, init=False)
+    _seeded: bool = attrs.field(default=False, init=False)
+
+    def record(self, rows: list[StatsRow]) -> RecordSummary:
+        """
+        Record one sampling tick. Rows of the same torrent must come in
+        ascending `recorded_time` across calls.
+        """
+        to_time = TorrentStats.recorded_time.db_value
+
+        if not self.record_on_change:
+            for row in rows:
+                self._runs[row.torrent_id] = _Run(
+                    values=row[2:], head_time=to_time(row.recorded_time)
+                )
+            inserted = insert_torrent_stats(rows, ignore_conflicts=True)
+            return RecordSummary(inserted=inserted, extended=0)
+
+        if not self._seeded:
+            self._seed_from_db([row.torrent_id for row in rows])
+            self._seeded = True
+
+        heartbeat = int(self.heartbeat.total_seconds())
+        to_insert: list[StatsRow] = []
+        # old tail time -> torrents whose tail moves to the new time
+        to_extend: dict[tuple[int, int], list[int]] = defaultdict(list)
+
+        for row in rows:
+            values = row[2:]
+            sample_time = to_time(row.recorded_time)
+            run = self._runs.get(row.torrent_id)
+
+            if (
+                run is None
+                or run.values != values
+                or sample_time - run.head_time >= heartbeat
+            ):
+                # Changed (or heartbeat due): start a new run
+                to_insert.append(row)
+                self._runs[row.torrent_id] = _Run(values=values, head_time=sample_time)
+            elif run.tail_time is None:
+                # Unchanged, the run gets its tail row
+                if sample_time != run.head_time:
+                    to_insert.append(row)
+                    run.tail_time = sample_time
+            elif sample_time != run.tail_time:
+                # Unchanged, move the tail row forward
+                to_extend[(run.tail_time, sample_time)].append(row.torrent_id)
+                run.tail_time = sample_time
+
+        extended = 0
+        batch_size = max_variable_number() - 2
+        with TorrentStats._meta.database.atomic():  # type: ignore
+            for (old_time, new_time), torrent_ids in to_extend.items():
+                for batch in peewee.chunked(torrent_ids, batch_size):
+                    extended += (
+                        TorrentStats.update(recorded_time=new_time)
+                        .where(
+                            (TorrentStats.recorded_time == old_time)
+                            & (TorrentStats.torrent.in_(batch))
+                        )
+                        .execute()
+                    )
+            inserted = insert_torrent_stats(to_insert, ignore_conflicts=True)
+
+        return RecordSummary(inserted=inserted, extended=extended)
+
+    def _seed_from_db(self, torrent_ids: list[int]):
+        """
+        Load the latest stored sample of the given torrents, so that the
+        first tick after a restart does not write a row for idle torrents.
+        """
+        for batch in peewee.chunked(torrent_ids, max_variable_number()):
+            latest = (
+                TorrentLatestStats.select(
+                    TorrentLatestStats.torrent,
+                    TorrentLatestStats.recorded_time.coerce(False),
+                    TorrentLatestStats.connected_seeders,
+                    TorrentLatestStats.swarm_seeders,
+                    TorrentLatestStats.connected_leechers,
+                    TorrentLatestStats.swarm_leechers,
+                    TorrentLatestStats.uploaded_bytes,
+                    TorrentLatestStats.downloaded_bytes,
+                )
+                .where(TorrentLatestStats.torrent.in_(batch))
+                .tuples()
+            )
+            for torrent_id, latest_time, *values in latest:
+                # The latest row may be the tail of an older run, treat
+                # it as a head so that it is never moved.
+                self._runs[torrent_id] = _Run(
+                    values=tuple(values), head_time=latest_time
+                )
@@ -0,0 +1,46 @@
+from pt_stats.db.database import conn
+from pt_stats.db.models import (
+    Sites,
+    Torrents,
+    TorrentStats,
+    TorrentLatestStats,
+    TorrentUsage,
+    UsageTotals,
+    TorrentScore,
+    TorrentStatsHourly,
+    TorrentStatsDaily,
+    TransferRollup,
+    TorrentFileCache,
+    StatsComputed,
+    TorrentsComputed,
+)
+
+# Tables of the application, in creation order
+TABLES = [
+    Sites,
+    Torrents,
+    TorrentStats,
+    TorrentLatestStats,
+    TorrentUsage,
+    UsageTotals,
+    TorrentScore,
+    TorrentStatsHourly,
+    TorrentStatsDaily,
+    TransferRollup,
+    TorrentFileCache,
+]
+
+
+def create_schema():
+    """
+    Create the missing tables and indexes, the triggers and the views.
+    Safe to run on an existing database: the tables maintained by
+    triggers are filled from the existing data if they are empty.
+    """
+    conn.create_tables(TABLES)
+
+    TorrentLatestStats.create_triggers()
+    TorrentUsage.create_triggers()
+    TransferRollup.create_triggers()
+    StatsComputed.create_view()
+    TorrentsComputed.create_view()
@@ -0,0 +1,157 @@
+import numpy as np
+import peewee
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from pt_stats.db.models import Torrents, TorrentStats, TorrentScore
+from pt_stats.db.writer import max_variable_number
+
+SAMPLE_DTYPE = np.dtype(
+    [
+        ("torrent_id", np.int64),
+        ("recorded_time", np.int64),
+        ("uploaded_bytes", np.int64),
+        ("swarm_seeders", np.int64),
+        ("swarm_leechers", np.int64),
+    ]
+)
+
+SELECT_RECENT_SAMPLES = r"""
+SELECT
+    ts.torrent_id, ts.recorded_time, ts.uploaded_bytes,
+    ts.swarm_seeders, ts.swarm_leechers
+FROM torrentstats ts
+JOIN torrents t ON t.id = ts.torrent_id
+WHERE t.delete_time IS NULL
+  AND ts.recorded_time >= ? AND ts.recorded_time <= ?
+ORDER BY ts.torrent_id, ts.recorded_time
+"""
+
+
+class TorrentScores(NamedTuple):
+    torrent_id: np.ndarray
+    upload_rate: np.ndarray  # bytes per second
+    demand: np.ndarray  # swarm leechers per seeder
+    score: np.ndarray
+
+
+def load_recent_samples(
+    start_ts: int, end_ts: int, chunk_size: int = 50_000
+) -> np.ndarray:
+    """
+    Samples of the torrents that are not deleted within [start_ts, end_ts],
+    as a structured array (`SAMPLE_DTYPE`) sorted by torrent and time.
+    The rows are fetched `chunk_size` at a time.
+    """
+    conn = TorrentStats._meta.database  # type: ignore
+    cursor = conn.execute_sql(SELECT_RECENT_SAMPLES, (start_ts, end_ts))
+    chunks = [np.empty(0, dtype=SAMPLE_DTYPE)]
+    while rows := cursor.fetchmany(chunk_size):
+        chunks.append(np.array(rows, dtype=SAMPLE_DTYPE))
+    return np.concatenate(chunks)
+
+
+def score_samples(
+    samples: np.ndarray,
+    now_ts: int,
+    *,
+    half_life: timedelta,
+    demand_weight: float,
+) -> TorrentScores:
+    """
+    Score the torrents of `samples` (sorted by torrent and time).
+
+    - The upload rate is the uploaded bytes over the elapsed time between
+      consecutive samples, both weighted by exp(-age / half life) of the
+      later sample, so recent activity dominates. A drop of the counter
+      (e.g., the torrent was re-added) counts the new value as uploaded.
+    - The demand is the decayed mean of `swarm_leechers / swarm_seeders`.
+
+    The score is the upload rate in GiB per day plus `demand_weight` times
+    the demand, so torrents without recent uploads still rank by demand.
+    """
+    torrent_ids, group = np.unique(samples["torrent_id"], return_inverse=True)
+    n = len(torrent_ids)
+    times = samples["recorded_time"].astype(np.float64)
+    uploaded = samples["uploaded_bytes"]
+    half_life_s = half_life.total_seconds()
+
+    # Intervals between consecutive samples of the same torrent
+    same = group[1:] == group[:-1]
+    d_up = np.diff(uploaded)
+    d_up = np.where(d_up < 0, uploaded[1:], d_up)[same].astype(np.float64)
+    dt = np.diff(times)[same]
+    w_interval = np.exp2(-(now_ts - times[1:][same]) / half_life_s)
+    interval_group = group[1:][same]
+
+    up_w = np.bincount(interval_group, weights=d_up * w_interval, minlength=n)
+    dt_w = np.bincount(interval_group, weights=dt * w_interval, minlength=n)
+    upload_rate = np.divide(up_w, dt_w, out=np.zeros(n), where=dt_w > 0)
+
+    w_sample = np.exp2(-(now_ts - times) / half_life_s)
+    ratio = samples["swarm_leechers"] / np.maximum(samples["swarm_seeders"], 1)
+    demand_num = np.bincount(group, weights=ratio * w_sample, minlength=n)
+    demand_den = np.bincount(group, weights=w_sample, minlength=n)
+    demand = np.divide(demand_num, demand_den, out=np.zeros(n), where=demand_den > 0)
+
+    score = upload_rate * 86400 / 2**30 + demand_weight * demand
+    return TorrentScores(
+        torrent_id=torrent_ids,
+        upload_rate=upload_rate,
+        demand=demand,
+        score=score,
+    )
+
+
+def compute_torrent_scores(
+    now: datetime,
+    *,
+    window: timedelta,
+    half_life: timedelta,
+    demand_weight: float,
+) -> TorrentScores:
+    """
+    Score the torrents that are not deleted from their samples of the last
+    `window` (see `score_samples`). Only reads the database, so it can run
+    on a reader thread; `replace_torrent_scores` stores the result.
+
+    Only raw samples are read, so `window` should not be longer than the
+    raw retention of the statistics.
+    """
+    now_ts = TorrentStats.recorded_time.db_value(now)
+    samples = load_recent_samples(now_ts - int(window.total_seconds()), now_ts)
+    return score_samples(
+        samples, now_ts, half_life=half_life, demand_weight=demand_weight
+    )
+
+
+def replace_torrent_scores(now: datetime, scores: TorrentScores) -> int:
+    """
+    Replace the `TorrentScore` table with `scores`, computed at `now`.
+    Torrents that are not deleted and have no score get a score of 0.
+    Returns the number of rows written.
+    """
+    now_ts = TorrentScore.computed_time.db_value(now)
+    scored = {
+        int(tid): (float(rate), float(demand), float(score))
+        for tid, rate, demand, score in zip(*scores)
+    }
+    fields = [
+        TorrentScore.torrent,
+        TorrentScore.computed_time,
+        TorrentScore.upload_rate,
+        TorrentScore.demand,
+        TorrentScore.score,
+    ]
+    with TorrentScore._meta.database.atomic():  # type: ignore
+        alive = [
+            tid
+            for (tid,) in Torrents.select(Torrents.id)
+            .where(Torrents.delete_time.is_null())
+            .tuples()
+        ]
+        rows = [(tid, now_ts, *scored.get(tid, (0.0, 0.0, 0.0))) for tid in alive]
+        TorrentScore.delete().execute()
+        for batch in peewee.chunked(rows, max_variable_number() // len(fields)):
+            TorrentScore.insert_many(batch, fields=fields).execute()
+
+    return len(rows)
@@ -0,0 +1,36 @@
+import peewee
+from typing import Mapping
+from pt_stats.db.models import TorrentUsage, UsageTotals
+from pt_stats.db.writer import max_variable_number
+
+
+def total_used_bytes() -> int:
+    """
+    Disk space counted for all torrents that are not deleted, read from
+    the `usage_totals` counter.
+    """
+    total = UsageTotals.select(UsageTotals.used_bytes).where(UsageTotals.id == 1)
+    return total.scalar() or 0
+
+
+def reconcile_torrent_usage(used_bytes: Mapping[int, int]) -> int:
+    """
+    Set `torrent_usage.used_bytes` of the given torrents (torrent id ->
+    bytes), e.g. to the size reported by qBittorrent. Torrents without a
+    usage row (deleted ones) are ignored. Returns the number of rows
+    updated.
+    """
+    updated = 0
+    items = list(used_bytes.items())
+    # Every torrent takes 3 variables: 2 in the CASE, 1 in the IN list
+    batch_size = max(1, max_variable_number() // 3)
+    with TorrentUsage._meta.database.atomic():  # type: ignore
+        for batch in peewee.chunked(items, batch_size):
+            updated += (
+                TorrentUsage.update(used_bytes=peewee.Case(TorrentUsage.torrent, batch))
+                .where(
+                    TorrentUsage.torrent.in_([torrent_id for torrent_id, _ in batch])
+                )
+                .execute()
+            )
+    return updated
@@ -0,0 +1,73 @@
+import sqlite3
+from datetime import datetime
+from typing import Iterable, NamedTuple
+import peewee
+from pt_stats.db.models import TorrentStats
+
+
+class StatsRow(NamedTuple):
+    """
+    A plain tuple holding one `TorrentStats` row, in column order.
+    """
+
+    torrent_id: int
+    recorded_time: datetime
+    connected_seeders: int
+    swarm_seeders: int
+    connected_leechers: int
+    swarm_leechers: int
+    uploaded_bytes: int
+    downloaded_bytes: int
+
+
+STATS_ROW_FIELDS = [
+    TorrentStats.torrent,
+    TorrentStats.recorded_time,
+    TorrentStats.connected_seeders,
+    TorrentStats.swarm_seeders,
+    TorrentStats.connected_leechers,
+    TorrentStats.swarm_leechers,
+    TorrentStats.uploaded_bytes,
+    TorrentStats.downloaded_bytes,
+]
+
+
+def max_variable_number() -> int:
+    """
+    The maximum number of host parameters in a single SQLite statement,
+    read from the database connection (builds may lower it at compile
+    time). Falls back to 999, the lowest default of SQLite, when it
+    cannot be read.
+    """
+    try:
+        connection = TorrentStats._meta.database.connection()  # type: ignore
+        return connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except (AttributeError, peewee.PeeweeException, sqlite3.Error):
+        return 999
+
+
+def insert_torrent_stats(
+    rows: Iterable[tuple], *, ignore_conflicts: bool = False
+) -> int:
+    """
+    Insert plain `StatsRow`-ordered tuples into `TorrentStats` with
+    multi-row INSERT statements, chunked to fit SQLite's variable limit.
+
+    If `ignore_conflicts` is set, rows clashing with the unique index on
+    `(torrent, recorded_time)` are skipped (INSERT OR IGNORE) instead of
+    raising `peewee.IntegrityError`.
+
+    All chunks are written in one transaction. Returns the number of rows
+    inserted, without the skipped ones.
+    """
+    batch_size = max_variable_number() // len(STATS_ROW_FIELDS)
+    count = 0
+
+    with TorrentStats._meta.database.atomic():  # type: ignore
+        for batch in peewee.chunked(rows, batch_size):
+            query = TorrentStats.insert_many(batch, fields=STATS_ROW_FIELDS)
+            if ignore_conflicts:
+                query = query.on_conflict_ignore()
+            count += query.as_rowcount().execute()
+
+    return count
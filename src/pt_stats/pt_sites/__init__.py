@@ -1,8 +1,10 @@
 from .base import SiteClient
 from .mteam import MTeamClient
+from .utils import Throttle
 
 
 __all__ = [
     "SiteClient",
     "MTeamClient",
+    "Throttle",
 ]
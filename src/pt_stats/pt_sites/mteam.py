@@ -1,5 +1,14 @@
+import asyncio
 import httpx
-from typing import override, Annotated, Literal
+from typing import (
+    override,
+    Annotated,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Literal,
+    Sequence,
+)
 import attrs
 import os
 from furl import furl
@@ -10,6 +19,8 @@ from pydantic import BeforeValidator, Field, AliasPath, AfterValidator
 
 SITE_NAME = "MTeam"
 
+SearchMode = Literal["adult", "normal", "movie", "tvshow"]
+
 
 class MTeamAPIError(Exception):
     def __init__(self, code: int, message: str):
@@ -72,9 +83,27 @@ class MTeamClient(SiteClient):
     api_base: furl = attrs.field(converter=furl)
     http_client: httpx.AsyncClient = attrs.field(factory=lambda: httpx.AsyncClient())
 
+    # Budget shared by all requests of this client. Pass the same
+    # throttle to several clients to share the budget among them.
     throttle: Throttle = attrs.field(default=attrs.Factory(lambda: Throttle(rate=2)))
 
+    # Budgets of the single endpoints, on top of the shared one. None
+    # leaves an endpoint to the shared budget alone (for searches and
+    # download tokens) or unlimited (for downloading .torrent files).
+    search_throttle: Throttle | None = None
+    dl_token_throttle: Throttle | None = None
+    download_throttle: Throttle | None = None
+
     def __attrs_post_init__(self):
+        # Endpoint budgets draw from the shared one
+        for endpoint_throttle in (
+            self.search_throttle,
+            self.dl_token_throttle,
+            self.download_throttle,
+        ):
+            if endpoint_throttle is not None and endpoint_throttle.parent is None:
+                endpoint_throttle.parent = self.throttle
+
         # Insert the auth plugin
         self.http_client.auth = MTeamAuthPlugin(
             whitelist=[self.api_base.host],  # type: ignore
@@ -88,7 +117,7 @@ class MTeamClient(SiteClient):
         self,
         *,
         keyword: str | None = None,
-        mode: Literal["adult", "normal", "movie", "tvshow"] = "normal",
+        mode: SearchMode = "normal",
         categories: list[str] = [],
         visible: Literal[0, 1, 2] = 1,
         page_number: int = 1,
@@ -125,7 +154,7 @@ class MTeamClient(SiteClient):
             (other possible values not yet known)
 
         """
-        await self.throttle()
+        await (self.search_throttle or self.throttle)()
 
         search_params = {
             "mode": mode,
@@ -158,28 +187,122 @@ class MTeamClient(SiteClient):
 
     @override
     async def list_latest_free_torrents(self) -> list[MTeamTorrentInfoFromSearch]:
-        await self.throttle()
-
-        normal_content = await self.search_torrents(
-            mode="normal", page_number=1, page_size=40, discount="FREE"
-        )
-        part_a = normal_content.get("data", {}).get("data", [])
-
-        adult_content = await self.search_torrents(
-            mode="adult", page_number=1, page_size=40, discount="FREE"
-        )
-        part_b = adult_content.get("data", {}).get("data", [])
-
-        torrents: list[MTeamTorrentInfoFromSearch] = []
-        for item in part_a + part_b:
-            torrent_info = MTeamTorrentInfoFromSearch.model_validate(item)
-            torrents.append(torrent_info)
+        return [
+            t
+            async for t in self.crawl_free_torrents(
+                modes=("normal", "adult"), page_size=40, max_pages=1
+            )
+        ]
 
-        return torrents
+    async def crawl_free_torrents(
+        self,
+        *,
+        modes: Sequence[SearchMode] = ("normal", "adult", "movie", "tvshow"),
+        page_size: int = 100,
+        max_pages: int = 10,
+        page_retries: int = 1,
+        known: Callable[[list[str]], Awaitable[set[str]]] | None = None,
+    ) -> AsyncIterator[MTeamTorrentInfoFromSearch]:
+        """Crawl the free torrents of all `modes` concurrently.
+
+        Each mode is paginated from the newest torrents on, until a page
+        is short (the last one), `max_pages` is reached, or a page holds
+        nothing new: every torrent on it is either expired (no free time
+        left) or already known.
+
+        A page request that fails is retried `page_retries` times. If it
+        still fails, the failure is printed and that mode stops, keeping
+        what the other modes (and the earlier pages) found. The error is
+        only raised when every mode failed and nothing was found.
+
+        known: Optional callback receiving the sitewise IDs of a page and
+            returning those that are already known (e.g. in the database).
+            Known torrents are not yielded.
+
+        Torrents are yielded as soon as their page arrives, deduplicated by
+        sitewise ID across modes. All requests go through the client
+        throttle, so the crawl stays within its rate budget.
+        """
+        queue: asyncio.Queue[MTeamTorrentInfoFromSearch | None] = asyncio.Queue()
+        errors: list[Exception] = []
+
+        async def fetch_page(
+            mode: SearchMode, page_number: int
+        ) -> list[MTeamTorrentInfoFromSearch]:
+            retries = page_retries
+            while True:
+                try:
+                    content = await self.search_torrents(
+                        mode=mode,
+                        page_number=page_number,
+                        page_size=page_size,
+                        discount="FREE",
+                    )
+                    break
+                except Exception as e:
+                    if retries <= 0:
+                        raise
+                    retries -= 1
+                    print(f"Retrying MTeam {mode} page {page_number}: {e}")
+            items = content.get("data", {}).get("data", []) or []
+            return [MTeamTorrentInfoFromSearch.model_validate(i) for i in items]
+
+        async def crawl_mode(mode: SearchMode):
+            try:
+                for page_number in range(1, max_pages + 1):
+                    try:
+                        page = await fetch_page(mode, page_number)
+                    except Exception as e:
+                        print(f"Failed to crawl MTeam {mode} page {page_number}: {e}")
+                        errors.append(e)
+                        break
+
+                    known_ids = set()
+                    if known is not None and page:
+                        known_ids = await known([t.sitewise_id for t in page])
+
+                    fresh = [
+                        t
+                        for t in page
+                        if t.sitewise_id not in known_ids
+                        and t.remain_free_duration > timedelta(0)
+                    ]
+                    for t in fresh:
+                        queue.put_nowait(t)
+
+                    if not fresh or len(page) < page_size:
+                        break
+            finally:
+                # Marks the end of this mode
+                queue.put_nowait(None)
+
+        tasks = [asyncio.create_task(crawl_mode(mode)) for mode in modes]
+        try:
+            seen: set[str] = set()
+            remaining = len(tasks)
+            while remaining > 0:
+                t = await queue.get()
+                if t is None:
+                    remaining -= 1
+                    continue
+                if t.sitewise_id in seen:
+                    continue
+                seen.add(t.sitewise_id)
+                yield t
+
+            # Surface other failures, and the page failures if every mode
+            # failed without finding anything
+            for task in tasks:
+                task.result()
+            if errors and len(errors) == len(tasks) and not seen:
+                raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
 
     @override
     async def download_torrent_metadata(self, sitewise_id: str) -> bytes:
-        await self.throttle()
+        await (self.dl_token_throttle or self.throttle)()
 
         res = await self.http_client.post(
             (self.api_base / "torrent" / "genDlToken").url, data={"id": sitewise_id}
@@ -199,6 +322,8 @@ class MTeamClient(SiteClient):
         dl_link = data.get("data", "")
 
         # Downloading the torrent file
+        if self.download_throttle is not None:
+            await self.download_throttle()
         res = await self.http_client.get(dl_link)  # TODO: limit the response body size
         res.raise_for_status()
 
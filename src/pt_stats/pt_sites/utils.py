@@ -16,13 +16,57 @@ def localize2utc(dt: datetime) -> datetime:
 
 @attrs.define
 class Throttle:
-    rate: float  # actions per second
-    last_time: float = attrs.field(default=0.0)
+    """
+    Token bucket rate limiter for asyncio.
 
-    async def __call__(self):
+    The bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second. Every call takes one token, waiting for it when the bucket is
+    empty, so at most `burst` calls go through at once and `rate` calls
+    per second on average. A new throttle starts with a full bucket.
+
+    Callers are served in arrival order: the lock is held while waiting
+    for a token, so a late caller cannot take it ahead of an earlier one.
+
+    With a `parent`, a call also takes a token from the parent, at the
+    same time as its own. Per endpoint throttles can so share one overall
+    budget, and a parent can be shared by several clients.
+
+    Usage:
+        site = Throttle(rate=2)
+        search = Throttle(rate=1, burst=4, parent=site)
+        await search()  # before each search request
+    """
+
+    # Tokens per second, and the bucket capacity
+    rate: float = attrs.field(validator=attrs.validators.gt(0))
+    burst: float = attrs.field(default=1.0, validator=attrs.validators.ge(1))
+    parent: "Throttle | None" = None
+
+    _tokens: float = attrs.field(init=False)
+    _last_time: float = attrs.field(init=False, factory=time.monotonic)
+    _lock: asyncio.Lock = attrs.field(factory=asyncio.Lock, init=False)
+
+    def __attrs_post_init__(self):
+        self._tokens = self.burst
+
+    def _refill(self):
         now = time.monotonic()
-        elapsed = now - self.last_time
-        wait_time = 1.0 / self.rate - elapsed
-        if wait_time > 0:
-            await asyncio.sleep(wait_time)
-        self.last_time = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last_time) * self.rate
+        )
+        self._last_time = now
+
+    async def __call__(self):
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+            # Nobody else takes our tokens while we hold the lock, so the
+            # token is still there once the parent let us through. Taking
+            # both at the same moment keeps both rates exact.
+            if self.parent is not None:
+                await self.parent()
+
+            self._refill()
+            self._tokens -= 1
@@ -0,0 +1,9 @@
+from .maindata import MainDataSync
+from .verify import AddVerifier
+from .client import AsyncQbtClient
+
+__all__ = [
+    "MainDataSync",
+    "AddVerifier",
+    "AsyncQbtClient",
+]
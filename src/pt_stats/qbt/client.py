@@ -0,0 +1,75 @@
+import asyncio as aio
+import functools
+import attrs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from qbittorrentapi import Client as QbtClient
+import qbittorrentapi as qbt_types
+
+
+@attrs.define
+class AsyncQbtClient:
+    """
+    Asyncio facade over the synchronous `qbittorrentapi.Client`.
+
+    Every request runs on a small dedicated thread pool, so a slow WebUI
+    never blocks the event loop, and several requests can be in flight
+    at once. The underlying `requests` session keeps its connections
+    alive, its pool is sized to the number of worker threads.
+
+    Only the endpoints used by the application are wrapped; the
+    synchronous client is available as `client` for everything else.
+    """
+
+    client: QbtClient
+    max_workers: int = 4
+
+    _executor: ThreadPoolExecutor = attrs.field(init=False)
+
+    @_executor.default
+    def _default_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="qbt"
+        )
+
+    @staticmethod
+    def create(
+        *, host: str, username: str, password: str, max_workers: int = 4
+    ) -> "AsyncQbtClient":
+        client = QbtClient(
+            host=host,
+            username=username,
+            password=password,
+            HTTPADAPTER_ARGS={
+                "pool_connections": max_workers,
+                "pool_maxsize": max_workers,
+            },
+        )
+        return AsyncQbtClient(client=client, max_workers=max_workers)
+
+    async def _call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = aio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def auth_log_in(self):
+        return await self._call(self.client.auth_log_in)
+
+    async def sync_maindata(self, rid: int = 0) -> qbt_types.SyncMainDataDictionary:
+        return await self._call(self.client.sync_maindata, rid=rid)
+
+    async def torrents_info(self, **kwargs) -> qbt_types.TorrentInfoList:
+        return await self._call(self.client.torrents_info, **kwargs)
+
+    async def torrents_add(self, **kwargs) -> str:
+        return await self._call(self.client.torrents_add, **kwargs)
+
+    async def torrents_delete(self, **kwargs):
+        return await self._call(self.client.torrents_delete, **kwargs)
+
+    def close(self):
+        """
+        Wait for the running requests and stop the worker threads.
+        """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,56 @@
+import attrs
+from typing import Any, Mapping
+
+
+@attrs.define
+class MainDataSync:
+    """
+    Local mirror of the torrent list of qBittorrent, kept up to date with
+    the `sync/maindata` delta API.
+
+    qBittorrent remembers what it has sent for each `rid`, so every call
+    after the first one only carries the fields that changed since the
+    previous response. The merged state of every torrent is kept here, so
+    the caller can read a full snapshot without asking qBittorrent for it.
+
+    Usage:
+        maindata = MainDataSync()
+        changed = maindata.apply(qbt.sync_maindata(rid=maindata.rid))
+        info = maindata.torrents[torrent_hash]
+    """
+
+    rid: int = 0
+    torrents: dict[str, dict[str, Any]] = attrs.field(factory=dict)
+
+    def apply(self, data: Mapping[str, Any]) -> set[str]:
+        """
+        Merge a `sync/maindata` response into the local state.
+
+        Returns the hashes of the torrents that were added or changed by
+        this response. Removed torrents are dropped from the state and
+        are not part of the returned set.
+        """
+        if data.get("full_update", False):
+            # qBittorrent lost track of our rid (or this is the first
+            # call), the response carries the complete torrent list.
+            self.torrents = {}
+
+        changed: set[str] = set()
+        for torrent_hash, fields in (data.get("torrents") or {}).items():
+            state = self.torrents.setdefault(torrent_hash, {})
+            state.update(fields)
+            changed.add(torrent_hash)
+
+        for torrent_hash in data.get("torrents_removed") or []:
+            self.torrents.pop(torrent_hash, None)
+            changed.discard(torrent_hash)
+
+        self.rid = data.get("rid", self.rid)
+        return changed
+
+    def reset(self):
+        """
+        Forget the local state, the next call gets a full update.
+        """
+        self.rid = 0
+        self.torrents = {}
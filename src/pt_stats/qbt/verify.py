@@ -0,0 +1,91 @@
+import asyncio as aio
+import time
+import attrs
+from typing import Awaitable, Callable, Iterable
+
+
+@attrs.define
+class AddVerifier:
+    """
+    Verify that torrents submitted to qBittorrent actually show up in its
+    torrent list.
+
+    `torrents_add` returns "Ok." even when the addition fails, so every
+    added torrent has to be looked up afterwards. Instead of polling once
+    per torrent, all pending hashes are checked with one `fetch` call per
+    interval. The interval grows exponentially (from `initial_interval`
+    up to `max_interval`) and restarts when a new torrent is submitted.
+
+    `fetch` receives the pending hashes and returns those that qBittorrent
+    knows about.
+
+    Usage:
+        verifier = AddVerifier(fetch=present_hashes)
+        await verifier.wait(torrent_hash, timeout=20)
+    """
+
+    fetch: Callable[[list[str]], Awaitable[Iterable[str]]]
+    initial_interval: float = 0.5
+    max_interval: float = 4.0
+    backoff: float = 2.0
+
+    # torrent hash -> (future, deadline on the monotonic clock, timeout)
+    _pending: dict[str, tuple[aio.Future, float, float]] = attrs.field(
+        factory=dict, init=False
+    )
+    _interval: float = attrs.field(default=0.0, init=False)
+    _poller: aio.Task | None = attrs.field(default=None, init=False)
+
+    def submit(self, torrent_hash: str, timeout: float = 20) -> aio.Future:
+        """
+        Start verifying `torrent_hash`. The returned future resolves when
+        the torrent is listed by qBittorrent, or fails with `TimeoutError`
+        after `timeout` seconds.
+        """
+        if torrent_hash in self._pending:
+            return self._pending[torrent_hash][0]
+
+        fut = aio.get_running_loop().create_future()
+        self._pending[torrent_hash] = (fut, time.monotonic() + timeout, timeout)
+        self._interval = self.initial_interval
+
+        if self._poller is None or self._poller.done():
+            self._poller = aio.create_task(self._poll())
+        return fut
+
+    async def wait(self, torrent_hash: str, timeout: float = 20):
+        """
+        Submit `torrent_hash` and wait for its verification.
+        """
+        await self.submit(torrent_hash, timeout=timeout)
+
+    async def _poll(self):
+        while self._pending:
+            await aio.sleep(self._interval)
+            self._interval = min(self._interval * self.backoff, self.max_interval)
+
+            hashes = list(self._pending)
+            try:
+                present = set(await self.fetch(hashes))
+            except Exception as e:
+                # Keep trying until the deadlines, the WebUI may be busy
+                print(f"Failed to query qBittorrent for added torrents: {e}")
+                present = set()
+
+            now = time.monotonic()
+            for torrent_hash in hashes:
+                fut, deadline, timeout = self._pending[torrent_hash]
+                if fut.done():
+                    # The waiter was cancelled
+                    del self._pending[torrent_hash]
+                elif torrent_hash in present:
+                    fut.set_result(None)
+                    del self._pending[torrent_hash]
+                elif now >= deadline:
+                    fut.set_exception(
+                        TimeoutError(
+                            f"Failed to add torrent with hash {torrent_hash} "
+                            f"within {timeout} seconds."
+                        )
+                    )
+                    del self._pending[torrent_hash]
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import attrs
+import peewee
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+from pt_stats.db.models import Sites, TorrentFileCache
+
+
+class CachedTorrent(NamedTuple):
+    data: bytes  # the .torrent file
+    infohash: str
+    files: list[tuple[str, int]]  # (path, size) of the content files
+
+    @property
+    def content_size(self) -> int:
+        return sum(size for _, size in self.files)
+
+
+@attrs.define
+class TorrentCache:
+    """
+    On-disk cache of downloaded .torrent files, with their infohash and
+    file list, keyed by (site, sitewise_id).
+
+    The files are stored under `root` by the SHA-1 of their content, and
+    indexed by the `TorrentFileCache` table. When the cached files take
+    more than `max_bytes`, the least recently used ones are evicted.
+
+    All methods access the database, so call them the way any other
+    database call is made (e.g., through `DatabaseExecutor.write`).
+
+    Usage:
+        cache = TorrentCache(root="torrent_cache", max_bytes=256 * 2**20)
+        cached = cache.get(site, sitewise_id)
+        if cached is None:
+            cached = cache.put(site, sitewise_id, data, infohash, files)
+    """
+
+    root: Path = attrs.field(converter=Path)
+    max_bytes: int
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.torrent"
+
+    def get(self, site: Sites, sitewise_id: str) -> CachedTorrent | None:
+        """
+        Return the cached torrent, or None. Marks it as recently used.
+        """
+        entry = TorrentFileCache.get_or_none(
+            (TorrentFileCache.site == site)
+            & (TorrentFileCache.sitewise_id == sitewise_id)
+        )
+        if entry is None:
+            return None
+
+        try:
+            data = self._blob_path(entry.digest).read_bytes()
+        except FileNotFoundError:
+            # Removed behind our back, forget about it
+            entry.delete_instance()
+            return None
+
+        if hashlib.sha1(data).hexdigest() != entry.digest:
+            # Corrupted, download it again
+            entry.delete_instance()
+            return None
+
+        TorrentFileCache.update(last_access=datetime.now(timezone.utc)).where(
+            TorrentFileCache.id == entry.id
+        ).execute()
+
+        return CachedTorrent(
+            data=data,
+            infohash=entry.infohash,
+            files=[(path, size) for path, size in json.loads(entry.files)],
+        )
+
+    def put(
+        self,
+        site: Sites,
+        sitewise_id: str,
+        data: bytes,
+        infohash: str,
+        files: list[tuple[str, int]],
+    ) -> CachedTorrent:
+        """
+        Store a torrent (replacing a previous one with the same key), then
+        evict old torrents if the cache is over its size.
+        """
+        digest = hashlib.sha1(data).hexdigest()
+        path = self._blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first, so that a crash never
+            # leaves a truncated file under the final name.
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        cached = CachedTorrent(data=data, infohash=infohash, files=list(files))
+        with TorrentFileCache._meta.database.atomic():  # type: ignore
+            old = TorrentFileCache.get_or_none(
+                (TorrentFileCache.site == site)
+                & (TorrentFileCache.sitewise_id == sitewise_id)
+            )
+            TorrentFileCache.insert(
+                site=site,
+                sitewise_id=sitewise_id,
+                digest=digest,
+                file_size=len(data),
+                infohash=infohash,
+                files=json.dumps(cached.files),
+                content_size=cached.content_size,
+                last_access=datetime.now(timezone.utc),
+            ).on_conflict(
+                conflict_target=[TorrentFileCache.site, TorrentFileCache.sitewise_id],
+                preserve=[
+                    TorrentFileCache.digest,
+                    TorrentFileCache.file_size,
+                    TorrentFileCache.infohash,
+                    TorrentFileCache.files,
+                    TorrentFileCache.content_size,
+                    TorrentFileCache.last_access,
+                ],
+            ).execute()
+            if old is not None and old.digest != digest:
+                self._remove_unreferenced({old.digest})
+
+            self.evict()
+        return cached
+
+    def evict(self) -> int:
+        """
+        Drop the least recently used torrents until the cache fits in
+        `max_bytes`. Returns the number of torrents dropped.
+        """
+        total = TorrentFileCache.select(
+            peewee.fn.SUM(TorrentFileCache.file_size)
+        ).scalar()
+        if not total or total <= self.max_bytes:
+            return 0
+
+        evicted: list[TorrentFileCache] = []
+        for entry in TorrentFileCache.select().order_by(
+            TorrentFileCache.last_access, TorrentFileCache.id
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append(entry)
+            total -= entry.file_size
+
+        TorrentFileCache.delete().where(
+            TorrentFileCache.id.in_([e.id for e in evicted])
+        ).execute()
+
+        self._remove_unreferenced({e.digest for e in evicted})
+        return len(evicted)
+
+    def _remove_unreferenced(self, digests: set[str]):
+        # Identical files share one blob, keep those still referenced
+        in_use = {
+            digest
+            for (digest,) in TorrentFileCache.select(TorrentFileCache.digest)
+            .where(TorrentFileCache.digest.in_(list(digests)))
+            .tuples()
+        }
+        for digest in digests - in_use:
+            self._blob_path(digest).unlink(missing_ok=True)